@@ -0,0 +1,128 @@
+"""Export the table detection, table structure and CLIP image models to TensorRT engines.
+
+Usage:
+    python build_trt.py --config configs/model_config.yaml --output-dir engines
+
+Each model is exported to ONNX with dynamic batch (and, for the table models,
+image size) axes, then compiled to a BF16 engine with trtexec. Point the
+matching `trt_engine_path` entry under `models` in the config at the
+resulting .plan file to use it; models without an engine keep running
+through PyTorch.
+"""
+import argparse
+import os
+import subprocess
+
+import torch
+import yaml
+from transformers import AutoModelForObjectDetection, CLIPModel
+
+
+class _DetectionOutputs(torch.nn.Module):
+    """Expose a DETR-style model's logits and boxes as plain tensor outputs."""
+
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, pixel_values, pixel_mask):
+        outputs = self.model(pixel_values=pixel_values, pixel_mask=pixel_mask)
+        return outputs.logits, outputs.pred_boxes
+
+
+class _ImageFeatures(torch.nn.Module):
+    """Expose CLIP's image tower as a single-output module."""
+
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, pixel_values):
+        return self.model.get_image_features(pixel_values=pixel_values)
+
+
+def export_detection_model(name, onnx_path, max_batch, max_edge):
+    """Export a table transformer to ONNX with dynamic batch and image size."""
+    model = _DetectionOutputs(AutoModelForObjectDetection.from_pretrained(name).eval())
+    pixel_values = torch.randn(1, 3, 800, 800)
+    pixel_mask = torch.ones(1, 800, 800, dtype=torch.int64)
+    torch.onnx.export(
+        model,
+        (pixel_values, pixel_mask),
+        onnx_path,
+        input_names=["pixel_values", "pixel_mask"],
+        output_names=["logits", "pred_boxes"],
+        dynamic_axes={
+            "pixel_values": {0: "batch", 2: "height", 3: "width"},
+            "pixel_mask": {0: "batch", 1: "height", 2: "width"},
+            "logits": {0: "batch"},
+            "pred_boxes": {0: "batch"},
+        },
+        opset_version=17,
+    )
+    return {
+        "min": "pixel_values:1x3x320x320,pixel_mask:1x320x320",
+        "opt": f"pixel_values:{max_batch}x3x800x800,pixel_mask:{max_batch}x800x800",
+        "max": f"pixel_values:{max_batch}x3x{max_edge}x{max_edge},pixel_mask:{max_batch}x{max_edge}x{max_edge}",
+    }
+
+
+def export_image_model(name, onnx_path, max_batch):
+    """Export CLIP's image tower to ONNX with a dynamic batch axis."""
+    model = _ImageFeatures(CLIPModel.from_pretrained(name).eval())
+    torch.onnx.export(
+        model,
+        (torch.randn(1, 3, 224, 224),),
+        onnx_path,
+        input_names=["pixel_values"],
+        output_names=["image_embeds"],
+        dynamic_axes={"pixel_values": {0: "batch"}, "image_embeds": {0: "batch"}},
+        opset_version=17,
+    )
+    return {
+        "min": "pixel_values:1x3x224x224",
+        "opt": f"pixel_values:{max_batch}x3x224x224",
+        "max": f"pixel_values:{max_batch}x3x224x224",
+    }
+
+
+def build_engine(onnx_path, engine_path, shapes):
+    """Compile an ONNX model into a BF16 TensorRT engine with trtexec."""
+    subprocess.run(
+        [
+            "trtexec",
+            f"--onnx={onnx_path}",
+            "--bf16",
+            f"--minShapes={shapes['min']}",
+            f"--optShapes={shapes['opt']}",
+            f"--maxShapes={shapes['max']}",
+            f"--saveEngine={engine_path}",
+        ],
+        check=True,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--config", default="configs/model_config.yaml")
+    parser.add_argument("--output-dir", default="engines")
+    parser.add_argument("--max-batch", type=int, default=8)
+    parser.add_argument("--max-edge", type=int, default=1333)
+    args = parser.parse_args()
+
+    with open(args.config) as f:
+        models = yaml.safe_load(f)["models"]
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    for key in ("table_detection", "table_structure"):
+        onnx_path = os.path.join(args.output_dir, f"{key}.onnx")
+        shapes = export_detection_model(models[key]["name"], onnx_path, args.max_batch, args.max_edge)
+        build_engine(onnx_path, os.path.join(args.output_dir, f"{key}.plan"), shapes)
+
+    onnx_path = os.path.join(args.output_dir, "image.onnx")
+    shapes = export_image_model(models["image"]["name"], onnx_path, args.max_batch)
+    build_engine(onnx_path, os.path.join(args.output_dir, "image.plan"), shapes)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+from dataclasses import dataclass, field
+from typing import Any, List, Optional, Tuple
+import hashlib
+import json
+import os
+import sqlite3
+
+
+@dataclass(slots=True)
+class Chunk:
+    """A unit of document content passed between pipeline stages."""
+    id: str
+    text: str
+    type: str = "text"
+    start: int = 0
+    end: int = 0
+    bbox: tuple = ()
+    image: Any = None
+    headers: list = field(default_factory=list)
+    cells: list = field(default_factory=list)
+    next_chunk: Optional[str] = None
+    prev_chunk: Optional[str] = None
+
+    @property
+    def metadata(self) -> dict:
+        """Type-specific metadata as stored on knowledge graph nodes."""
+        if self.type == "table":
+            return {"bbox": self.bbox, "headers": self.headers, "cells": self.cells}
+        if self.type == "figure":
+            return {"bbox": self.bbox, "image": self.image}
+        return {"start": self.start, "end": self.end}
+
+
+class SectionCache:
+    """Content-addressed SQLite store of per-section sentence spans and token lengths."""
+
+    def __init__(self, cache_dir: str, namespace: str):
+        os.makedirs(cache_dir, exist_ok=True)
+        self.namespace = namespace
+        self._conn = sqlite3.connect(os.path.join(cache_dir, "sections.sqlite"))
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS sections (key TEXT PRIMARY KEY, value TEXT NOT NULL)"
+            )
+
+    def _key(self, text: str) -> str:
+        """Hash section text together with the namespace (e.g. tokenizer name)."""
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(self.namespace.encode("utf-8"))
+        digest.update(b"\x00")
+        digest.update(text.encode("utf-8"))
+        return digest.hexdigest()
+
+    def get_many(self, texts: List[str]) -> List[Optional[Tuple[list, list]]]:
+        """Look up (spans, lengths) for each text; misses are returned as None."""
+        keys = [self._key(text) for text in texts]
+        found = {}
+        # Stay well below SQLite's bound-parameter limit
+        for start in range(0, len(keys), 500):
+            batch = keys[start:start + 500]
+            placeholders = ",".join("?" * len(batch))
+            rows = self._conn.execute(
+                f"SELECT key, value FROM sections WHERE key IN ({placeholders})", batch
+            )
+            found.update(rows)
+
+        results = []
+        for key in keys:
+            if key in found:
+                value = json.loads(found[key])
+                results.append(([tuple(span) for span in value["spans"]], value["lengths"]))
+            else:
+                results.append(None)
+        return results
+
+    def put_many(self, items: List[Tuple[str, Tuple[list, list]]]) -> None:
+        """Store (spans, lengths) for each (text, value) pair."""
+        with self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO sections (key, value) VALUES (?, ?)",
+                [
+                    (self._key(text), json.dumps({"spans": spans, "lengths": lengths}))
+                    for text, (spans, lengths) in items
+                ]
+            )
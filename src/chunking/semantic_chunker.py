@@ -1,7 +1,27 @@
-from transformers import AutoTokenizer, AutoModel
+from transformers import AutoModel
 import spacy
 import numpy as np
 import re
+import functools
+from src.chunking.chunk_utils import Chunk, SectionCache
+from src.utils.model_registry import get_tokenizer
+
+
+@functools.lru_cache(maxsize=None)
+def _get_model(model_name):
+    """Load model weights once per model name."""
+    return AutoModel.from_pretrained(model_name)
+
+
+@functools.lru_cache(maxsize=None)
+def _get_sentencizer(lang="en"):
+    """Build a blank spaCy pipeline that only splits sentences."""
+    # Only sentence boundaries are needed, so a rule-based sentencizer
+    # replaces the full tagger/parser/NER pipeline
+    nlp = spacy.blank(lang)
+    nlp.add_pipe("sentencizer")
+    return nlp
+
 
 class SemanticContextPreservingChunker:
     def __init__(self, config):
@@ -10,28 +30,46 @@ class SemanticContextPreservingChunker:
         model_name = (config.get("models", {}).get("text_embedding", {}).get("name") or 
                      config.get("text_embedding_model", "sentence-transformers/all-mpnet-base-v2"))
         
-        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
-        self.model = AutoModel.from_pretrained(model_name)
+        self.model_name = model_name
+        self.tokenizer = get_tokenizer(model_name)
+        self.nlp = _get_sentencizer()
         
-        # Initialize spacy with download if needed
-        try:
-            self.nlp = spacy.load("en_core_web_sm")
-        except OSError:
-            print("Downloading spacy model...")
-            spacy.cli.download("en_core_web_sm")
-            self.nlp = spacy.load("en_core_web_sm")
-            
-        self.max_chunk_size = config.get("chunking", {}).get("max_chunk_size", 512)
+        # Common header patterns combined into one alternation:
+        # numbered sections, Title Case and ALL CAPS lines
+        self._header_re = re.compile(
+            r"^(?:[0-9]+\.[0-9]*\s+[A-Z]"
+            r"|[A-Z][a-z]+(?:\s+[A-Z][a-z]+){0,4}$"
+            r"|[A-Z\s]{4,}$)"
+        )
+
+        chunking_config = config.get("chunking", {})
+        self.max_chunk_size = chunking_config.get("max_chunk_size", 512)
+        self.spacy_batch_size = chunking_config.get("spacy_batch_size", 64)
+        self.spacy_n_process = chunking_config.get("spacy_n_process", 1)
+        
+        # Optional on-disk cache of sentence spans and token lengths per section,
+        # namespaced by tokenizer so a model change invalidates it
+        cache_dir = chunking_config.get("cache_dir")
+        self._section_cache = SectionCache(cache_dir, model_name) if cache_dir else None
         
+    @functools.cached_property
+    def model(self):
+        """Embedding model weights, loaded on first use; chunking only needs the tokenizer."""
+        return _get_model(self.model_name)
+
     def chunk_document(self, document):
         """Create semantic chunks while preserving context."""
         chunks = []
         
         # Process text blocks
         sections = self._identify_sections(document["text_blocks"])
-        for section in sections:
-            section_chunks = self._create_semantic_chunks(section)
-            chunks.extend(section_chunks)
+        # Join and segment one spaCy batch of sections at a time so the
+        # section texts never all live in memory at once
+        for start in range(0, len(sections), self.spacy_batch_size):
+            texts = [self._section_text(section) for section in sections[start:start + self.spacy_batch_size]]
+            for text, (spans, lengths) in zip(texts, self._segment_sections(texts)):
+                section_chunks = self._create_semantic_chunks(text, spans, lengths)
+                chunks.extend(section_chunks)
             
         # Process tables and figures
         self._process_tables(document["tables"], chunks)
@@ -49,109 +87,132 @@ class SemanticContextPreservingChunker:
             # Check if block starts a new section (e.g., headers)
             if self._is_section_header(text):
                 if current_section:
-                    sections.append({
-                        "text": "\n".join(b["text"] for b in current_section),
-                        "blocks": current_section
-                    })
+                    sections.append({"blocks": current_section})
                 current_section = []
             current_section.append(block)
             
         # Add final section if exists
         if current_section:
-            sections.append({
-                "text": "\n".join(b["text"] for b in current_section),
-                "blocks": current_section
-            })
+            sections.append({"blocks": current_section})
             
         return sections
+
+    def _section_text(self, section):
+        """Join the text of a section's blocks; built one spaCy batch at a time."""
+        return "\n".join(b["text"] for b in section["blocks"])
         
     def _is_section_header(self, text):
         """Check if text appears to be a section header."""
         # Basic heuristics for identifying headers
         text = text.strip()
-        if not text:
-            return False
+        return bool(text) and self._header_re.match(text) is not None
+
+    def _segment_sections(self, texts):
+        """Split sections into sentence spans and count tokens per sentence.
+        
+        Returns a (spans, lengths) pair per text, where spans are (start, end)
+        character offsets. Cached sections are served from disk; the rest go
+        through one nlp.pipe pass and one batched tokenizer call.
+        """
+        if self._section_cache is not None:
+            results = self._section_cache.get_many(texts)
+        else:
+            results = [None] * len(texts)
+        missing = [i for i, result in enumerate(results) if result is None]
+        if not missing:
+            return results
+        
+        docs = self.nlp.pipe(
+            (texts[i] for i in missing),
+            batch_size=self.spacy_batch_size,
+            n_process=self.spacy_n_process
+        )
+        section_spans = [[(sent.start_char, sent.end_char) for sent in doc.sents] for doc in docs]
+        
+        # Tokenize every new sentence in one call; only the lengths are needed
+        sentences = [texts[i][start:end] for i, spans in zip(missing, section_spans) for start, end in spans]
+        lengths = self.tokenizer(
+            sentences,
+            add_special_tokens=False,
+            return_length=True,
+            return_attention_mask=False
+        )["length"] if sentences else []
+        
+        offset = 0
+        for i, spans in zip(missing, section_spans):
+            results[i] = (spans, lengths[offset:offset + len(spans)])
+            offset += len(spans)
             
-        # Check for common header patterns
-        header_patterns = [
-            r"^[0-9]+\.[0-9]*\s+[A-Z]",  # Numbered sections
-            r"^[A-Z][a-z]+(\s+[A-Z][a-z]+){0,4}$",  # Title Case
-            r"^[A-Z\s]{4,}$"  # ALL CAPS
+        if self._section_cache is not None:
+            self._section_cache.put_many([(texts[i], results[i]) for i in missing])
+        return results
+
+    def _create_semantic_chunks(self, text, spans, lengths):
+        """Create chunks based on the sentence boundaries of a section."""
+        return [
+            self._create_chunk_object(text, spans[start:end])
+            for start, end in self._chunk_boundaries(lengths)
         ]
-        
-        return any(re.match(pattern, text) for pattern in header_patterns)
 
-    def _create_semantic_chunks(self, section):
-        """Create chunks based on semantic boundaries."""
-        doc = self.nlp(section["text"])
-        sentences = list(doc.sents)
+    def _chunk_boundaries(self, lengths):
+        """Greedily pack sentences into chunks of at most max_chunk_size tokens.
         
-        chunks = []
-        current_chunk = []
-        current_tokens = 0
+        Returns (start, end) sentence index pairs. A sentence longer than the
+        limit forms a chunk on its own.
+        """
+        cumulative = np.cumsum(np.asarray(lengths, dtype=np.int64))
+        boundaries = []
+        start = 0
+        base = 0
         
-        for sent in sentences:
-            sent_tokens = len(self.tokenizer.encode(sent.text))
+        while start < len(cumulative):
+            # First sentence whose running total would overflow the chunk
+            end = int(np.searchsorted(cumulative, base + self.max_chunk_size, side="right"))
+            end = max(end, start + 1)
+            boundaries.append((start, end))
+            base = cumulative[end - 1]
+            start = end
             
-            if current_tokens + sent_tokens > self.max_chunk_size:
-                if current_chunk:
-                    chunks.append(self._create_chunk_object(current_chunk))
-                current_chunk = [sent]
-                current_tokens = sent_tokens
-            else:
-                current_chunk.append(sent)
-                current_tokens += sent_tokens
-                
-        if current_chunk:
-            chunks.append(self._create_chunk_object(current_chunk))
-            
-        return chunks
+        return boundaries
 
-    def _create_chunk_object(self, sentences):
-        """Create a chunk object from a list of sentences."""
-        text = " ".join([sent.text for sent in sentences])
-        return {
-            "id": self._generate_chunk_id(),
-            "text": text,
-            "metadata": {
-                "start": sentences[0].start_char,
-                "end": sentences[-1].end_char
-            }
-        }
+    def _create_chunk_object(self, text, spans):
+        """Create a chunk object from the character spans of its sentences."""
+        return Chunk(
+            id=self._generate_chunk_id(),
+            text=" ".join(text[start:end] for start, end in spans),
+            start=spans[0][0],
+            end=spans[-1][1]
+        )
 
     def _process_tables(self, tables, chunks):
         """Process and add tables as chunks."""
         for idx, table in enumerate(tables):
-            chunks.append({
-                "id": f"table_{idx}",
-                "text": self._table_to_text(table),
-                "type": "table",
-                "metadata": {
-                    "bbox": table.get("bbox", []),
-                    "headers": table.get("headers", []),
-                    "cells": table.get("cells", [])
-                }
-            })
+            chunks.append(Chunk(
+                id=f"table_{idx}",
+                text=self._table_to_text(table),
+                type="table",
+                bbox=tuple(table.get("bbox", ())),
+                headers=table.get("headers", []),
+                cells=table.get("cells", [])
+            ))
 
     def _process_figures(self, figures, chunks):
         """Process and add figures as chunks."""
         for idx, figure in enumerate(figures):
-            chunks.append({
-                "id": f"figure_{idx}",
-                "text": figure.get("caption", ""),
-                "type": "figure",
-                "metadata": {
-                    "bbox": figure.get("bbox", []),
-                    "image": figure.get("image", None)
-                }
-            })
+            chunks.append(Chunk(
+                id=f"figure_{idx}",
+                text=figure.get("caption", ""),
+                type="figure",
+                bbox=tuple(figure.get("bbox", ())),
+                image=figure.get("image", None)
+            ))
 
     def _link_chunks(self, chunks):
         """Link chunks based on semantic relationships and proximity."""
         # Add relationships between consecutive chunks
-        for i in range(len(chunks) - 1):
-            chunks[i]["next_chunk"] = chunks[i + 1]["id"]
-            chunks[i + 1]["prev_chunk"] = chunks[i]["id"]
+        for current, following in zip(chunks, chunks[1:]):
+            current.next_chunk = following.id
+            following.prev_chunk = current.id
             
         return chunks
 
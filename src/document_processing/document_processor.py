@@ -1,123 +1,312 @@
 import fitz
 from PIL import Image
+import numpy as np
 import io
 from transformers import AutoModelForObjectDetection, AutoProcessor, DetrImageProcessor
 import logging
 import torch
+import functools
+import gc
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from src.utils.device_utils import autocast, get_autocast_dtype, get_device, maybe_compile
+from src.utils.trt_runner import load_trt_engine
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+
+def _extract_page(page, doc):
+    """Extract (text_blocks, figures) from a page; figures carry encoded image bytes."""
+    return (
+        MultimodalDocumentProcessor._extract_text_blocks(page),
+        MultimodalDocumentProcessor._extract_figures(page, doc)
+    )
+
+
+def _extract_page_range(file_path, page_nums):
+    """Worker-process entry point: open the document and extract a range of pages."""
+    with fitz.open(file_path) as doc:
+        return [_extract_page(doc[page_num], doc) for page_num in page_nums]
+
+
+@functools.lru_cache(maxsize=None)
+def _get_detection_model(model_name):
+    """Load an object detection model once per model name."""
+    return AutoModelForObjectDetection.from_pretrained(model_name)
+
+
+@functools.lru_cache(maxsize=None)
+def _get_processor(model_name):
+    """Load an image processor once per model name."""
+    return AutoProcessor.from_pretrained(model_name)
+
 
 class MultimodalDocumentProcessor:
     def __init__(self, config):
+        processing_config = config.get("document_processing", {}) if isinstance(config, dict) else {}
         self.config = config.get("models", {}) if isinstance(config, dict) else config
         
+        # Worker processes for text/figure extraction; 1 extracts on the calling thread
+        self.num_workers = processing_config.get("num_workers", 1)
+        # Peak RSS (MB) above which a full GC pass runs after each batch of pages
+        self.gc_rss_threshold_mb = processing_config.get("gc_rss_threshold_mb")
+        
+        # Run on GPU when available, with mixed precision autocast there
+        self.device = get_device()
+        self.dtype = get_autocast_dtype(self.device)
+        
         # Access model names safely with defaults
-        table_model = self.config.get("table_detection", {}).get("name", "microsoft/table-transformer-detection")
-        self.table_detector = AutoModelForObjectDetection.from_pretrained(table_model)
-        self.table_processor = AutoProcessor.from_pretrained(table_model)
+        table_detection_config = self.config.get("table_detection", {})
+        table_model = table_detection_config.get("name", "microsoft/table-transformer-detection")
+        # A prebuilt TensorRT engine replaces the PyTorch model when configured
+        self.table_detector = load_trt_engine(table_detection_config.get("trt_engine_path")) or maybe_compile(
+            _get_detection_model(table_model).to(self.device).eval(),
+            table_detection_config.get("compile", False)
+        )
+        self.table_processor = _get_processor(table_model)
+        # Edge lengths the detector resizes inputs to; pages larger than this
+        # at 72 DPI are rendered at this size directly rather than downscaled
+        image_processor = getattr(self.table_processor, "image_processor", self.table_processor)
+        input_size = getattr(image_processor, "size", None) or {}
+        self._detector_edges = (input_size.get("shortest_edge"), input_size.get("longest_edge"))
+        # Optional fixed render resolution, e.g. a lower DPI for faster detection
+        self.render_dpi = table_detection_config.get("render_dpi")
+        # Pages per detector forward pass; bounds peak memory on large documents
+        self.batch_size = table_detection_config.get("batch_size", 8)
+        self.confidence_threshold = table_detection_config.get("confidence_threshold", 0.7)
         
-        structure_model = self.config.get("table_structure", {}).get("name", "microsoft/table-transformer-structure-recognition")
-        self.table_structure_recognizer = AutoModelForObjectDetection.from_pretrained(structure_model)
+        self.structure_model_name = self.config.get("table_structure", {}).get("name", "microsoft/table-transformer-structure-recognition")
+
+    @functools.cached_property
+    def table_structure_recognizer(self):
+        """Table structure model, loaded on first use since detection does not need it."""
+        return _get_detection_model(self.structure_model_name)
 
     def process_document(self, file_path):
         """Process document and extract multimodal elements."""
         document = {"text_blocks": [], "tables": [], "figures": []}
-        doc = fitz.open(file_path)
         
-        for page_num, page in enumerate(doc):
-            # Extract text with positioning
-            text_blocks = self._extract_text_blocks(page)
-            document["text_blocks"].extend(text_blocks)
-            
-            # Extract tables
-            tables = self._extract_tables(page)
-            document["tables"].extend(tables)
-            
-            # Extract figures
-            figures = self._extract_figures(page, doc)
-            document["figures"].extend(figures)
+        for page in self.process_document_iter(file_path):
+            document["text_blocks"].extend(page["text_blocks"])
+            document["tables"].extend(page["tables"])
+            document["figures"].extend(page["figures"])
             
         return document
 
-    def _extract_text_blocks(self, page):
+    def process_document_iter(self, file_path):
+        """Yield {"page_num", "text_blocks", "tables", "figures"} for each page in order.
+        
+        Pages are processed one detector batch at a time, so at most one batch
+        of rendered pages is held in memory; callers that consume pages as
+        they arrive never hold the whole document. With num_workers > 1, worker
+        processes extract text and figures for upcoming batches while the
+        detector runs on the current one.
+        """
+        with fitz.open(file_path) as doc:
+            batches = [
+                range(start, min(start + self.batch_size, len(doc)))
+                for start in range(0, len(doc), self.batch_size)
+            ]
+            # PyMuPDF is not thread-safe and holds the GIL, so parallel
+            # extraction uses processes, each opening its own handle
+            use_workers = self.num_workers > 1 and len(batches) > 1
+            executor = ProcessPoolExecutor(max_workers=self.num_workers) if use_workers else None
+            
+            with executor or nullcontext():
+                # Keep one batch in flight per worker; results come back in page order
+                pending = deque(
+                    executor.submit(_extract_page_range, file_path, page_nums)
+                    for page_nums in batches[:self.num_workers]
+                ) if executor else None
+                
+                for batch_idx, page_nums in enumerate(batches):
+                    # Renders stay in this process; their arrays view pixmap memory
+                    if executor:
+                        extracted = pending.popleft().result()
+                        next_idx = batch_idx + self.num_workers
+                        if next_idx < len(batches):
+                            pending.append(executor.submit(_extract_page_range, file_path, batches[next_idx]))
+                        renders = [self._render_page_safe(doc[n]) for n in page_nums]
+                    else:
+                        extracted, renders = [], []
+                        for n in page_nums:
+                            page = doc[n]
+                            extracted.append(_extract_page(page, doc))
+                            renders.append(self._render_page_safe(page))
+                    
+                    # Detect tables for the whole batch at once
+                    page_tables = {page_num: [] for page_num in page_nums}
+                    page_images = [
+                        (n, image, page_size)
+                        for n, (image, page_size, _) in zip(page_nums, renders)
+                        if image is not None
+                    ]
+                    for table in self._extract_tables(page_images):
+                        page_tables[table["page_num"]].append(table)
+                        
+                    results = [
+                        {
+                            "page_num": page_num,
+                            "text_blocks": text_blocks,
+                            "tables": page_tables[page_num],
+                            "figures": self._open_figure_images(figures)
+                        }
+                        for page_num, (text_blocks, figures) in zip(page_nums, extracted)
+                    ]
+                    # Drop this batch's page renders (and their pixmaps) before moving on
+                    del renders, page_images
+                    self._maybe_collect_garbage()
+                    
+                    yield from results
+
+    def _maybe_collect_garbage(self):
+        """Run a full GC pass once peak RSS exceeds the configured threshold."""
+        if self.gc_rss_threshold_mb is None or resource is None:
+            return
+        # ru_maxrss is reported in kilobytes on Linux
+        peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        if peak_rss_mb > self.gc_rss_threshold_mb:
+            gc.collect()
+            # Return cached blocks from freed batch tensors to the device
+            if self.device == "cuda":
+                torch.cuda.empty_cache()
+
+    @staticmethod
+    def _open_figure_images(figures):
+        """Replace each figure's encoded image bytes with a PIL image, dropping undecodable ones."""
+        opened = []
+        for figure in figures:
+            image_bytes = figure.pop("image_bytes")
+            try:
+                figure["image"] = Image.open(io.BytesIO(image_bytes))
+            except Exception as e:
+                logging.error(f"Error opening figure image on page {figure['page_num']}: {str(e)}")
+                continue
+            opened.append(figure)
+        return opened
+
+    def _render_page_safe(self, page):
+        """Render a page, logging failures so the page only loses its own tables."""
+        try:
+            return self._render_page(page)
+        except Exception as e:
+            logging.error(f"Error rendering page {page.number}: {str(e)}")
+            return None, None, None
+
+    @staticmethod
+    def _extract_text_blocks(page):
         """Extract text blocks with spatial information."""
         blocks = []
-        page_dict = page.get_text("dict")
+        page_num = page.number
+        # Plain (x0, y0, x1, y1, text, block_no, block_type) tuples skip the
+        # per-span styling and image data computed for "dict" output
+        page_blocks = page.get_text("blocks", flags=fitz.TEXTFLAGS_TEXT)
         
-        for block in page_dict.get("blocks", []):
-            if block.get("type") == 0:  # Text block
-                try:
-                    text = ""
-                    # Extract text from spans if available
-                    if "lines" in block:
-                        for line in block["lines"]:
-                            for span in line.get("spans", []):
-                                text += span.get("text", "")
-                    # Fallback to direct text if available
-                    if not text and "text" in block:
-                        text = block["text"]
-                    
-                    if text:
-                        blocks.append({
-                            "text": text,
-                            "bbox": block.get("bbox", [0, 0, 0, 0]),
-                            "page_num": page.number
-                        })
-                except Exception as e:
-                    logging.warning(f"Error processing text block on page {page.number}: {str(e)}")
-                    continue
+        for x0, y0, x1, y1, text, _, block_type in page_blocks:
+            if block_type == 0:  # Text block
+                text = text.strip()
+                if text:
+                    blocks.append({
+                        "text": text,
+                        "bbox": (x0, y0, x1, y1),
+                        "page_num": page_num
+                    })
         
         return blocks
 
-    def _extract_tables(self, page):
-        """Extract tables from a page using the table detection model."""
+    def _render_scale(self, page):
+        """Scale factor that renders the page at the detector's input size, never above 72 DPI."""
+        if self.render_dpi:
+            return self.render_dpi / 72
+        shortest_edge, longest_edge = self._detector_edges
+        width, height = page.rect.width, page.rect.height
+        # Only scale down from the 72 DPI default; rendering larger costs more
+        # pixels per page, so that accuracy trade is left to render_dpi
+        scales = [1.0]
+        if shortest_edge:
+            scales.append(shortest_edge / min(width, height))
+        if longest_edge:
+            scales.append(longest_edge / max(width, height))
+        return min(scales)
+
+    def _render_page(self, page):
+        """Render a page to an RGB array for table detection.
+        
+        Returns the array, the page's (height, width) in PDF points, which
+        detections are mapped back to, and the pixmap owning the array's
+        memory; the pixmap must stay referenced while the array is in use.
+        """
+        scale = self._render_scale(page)
+        pix = page.get_pixmap(matrix=fitz.Matrix(scale, scale), alpha=False)
+        # View the pixmap's buffer as HxWxC in place; pix.samples would copy it
+        image = np.frombuffer(pix.samples_mv, dtype=np.uint8).reshape(pix.height, pix.width, pix.n)[:, :, :3]
+        return image, (page.rect.height, page.rect.width), pix
+
+    def _extract_tables(self, page_images):
+        """Extract tables from (page_num, image, page_size) triples, running the detector in batches."""
         tables = []
+        for start in range(0, len(page_images), self.batch_size):
+            tables.extend(self._detect_tables(page_images[start:start + self.batch_size]))
+        return tables
+
+    def _detect_tables(self, batch):
+        """Run the detector on one batch, retrying page by page if the batch fails."""
+        page_nums = [page_num for page_num, _, _ in batch]
+        images = [img for _, img, _ in batch]
+        
         try:
-            # Convert page to image
-            pix = page.get_pixmap()
-            img = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
-            
-            # Prepare image for model
-            inputs = self.table_processor(images=img, return_tensors="pt")
+            # Prepare images for model; the processor pads them to a common size
+            inputs = self.table_processor(images=images, return_tensors="pt").to(self.device)
             
-            # Get predictions
-            with torch.no_grad():
+            # Get predictions for the whole batch
+            with torch.inference_mode(), autocast(self.device, self.dtype):
                 outputs = self.table_detector(**inputs)
             
-            # Use new post-processing method
             results = self.table_processor.post_process_object_detection(
                 outputs,
-                threshold=0.7,
-                target_sizes=[(img.size[1], img.size[0])]
-            )[0]
-            
-            # Extract tables from results
-            for score, box in zip(results["scores"], results["boxes"]):
+                threshold=self.confidence_threshold,
+                target_sizes=[page_size for _, _, page_size in batch]
+            )
+        except Exception as e:
+            if len(batch) > 1:
+                # Isolate the failing page so the rest of the batch keeps its tables
+                logging.warning(f"Batched table detection failed on pages {page_nums[0]}-{page_nums[-1]}, retrying per page: {str(e)}")
+                return [table for item in batch for table in self._detect_tables([item])]
+            logging.error(f"Error detecting tables on page {page_nums[0]}: {str(e)}")
+            return []
+        
+        # Scatter results back to their pages
+        tables = []
+        for page_num, result in zip(page_nums, results):
+            for score, box in zip(result["scores"], result["boxes"]):
                 tables.append({
                     "confidence": score.item(),
                     "bbox": box.tolist(),
-                    "page_num": page.number
+                    "page_num": page_num
                 })
-                    
-        except Exception as e:
-            logging.error(f"Error detecting tables on page {page.number}: {str(e)}")
-            
         return tables
 
-    def _extract_figures(self, page, doc):
+    @staticmethod
+    def _extract_figures(page, doc):
         """Extract figures from a page."""
         figures = []
+        page_num = page.number
         try:
             for image_info in page.get_images(full=True):
                 xref = image_info[0]
                 base_image = doc.extract_image(xref)
                 
                 if base_image:
-                    image_bytes = base_image["image"]
-                    image = Image.open(io.BytesIO(image_bytes))
-                    
+                    # Encoded bytes are kept as-is; they are much smaller than
+                    # decoded pixels when sent back from a worker process
                     figures.append({
                         "bbox": list(image_info[1:5]),  # x0, y0, x1, y1
-                        "image": image,
-                        "page_num": page.number,
+                        "image_bytes": base_image["image"],
+                        "page_num": page_num,
                         "metadata": {
                             "colorspace": base_image["colorspace"],
                             "width": base_image["width"],
@@ -126,6 +315,6 @@ class MultimodalDocumentProcessor:
                     })
                     
         except Exception as e:
-            logging.error(f"Error extracting figures on page {page.number}: {str(e)}")
+            logging.error(f"Error extracting figures on page {page_num}: {str(e)}")
             
         return figures
\ No newline at end of file
@@ -1,17 +1,44 @@
 from PIL import Image
+import hashlib
 import io
+import os
+import re
+import numpy as np
 import torch
-from transformers import CLIPProcessor, CLIPModel
+from src.utils.device_utils import autocast, get_autocast_dtype, get_device, maybe_compile
+from src.utils.model_registry import get_clip_model, get_clip_processor
+from src.utils.trt_runner import load_trt_engine
 
 class FigureExtractor:
+    _caption_re = re.compile(r"\b(?:fig(?:ure|\.)?|image|illustration)\b", re.IGNORECASE)
+    
     def __init__(self, config):
         self.config = config
-        self.clip_processor = CLIPProcessor.from_pretrained(config.models["image"]["name"])
-        self.clip_model = CLIPModel.from_pretrained(config.models["image"]["name"])
+        self.device = get_device()
+        self.dtype = get_autocast_dtype(self.device)
+        self.clip_processor = get_clip_processor(config.models["image"]["name"])
+        self.clip_model = get_clip_model(config.models["image"]["name"], self.device)
+        # Only the image tower is used, so compile that entry point rather than forward();
+        # a prebuilt TensorRT engine replaces it when configured
+        image_engine = load_trt_engine(config.models["image"].get("trt_engine_path"))
+        if image_engine is not None:
+            self._image_features = lambda **inputs: image_engine(**inputs).image_embeds
+        else:
+            self._image_features = maybe_compile(
+                self.clip_model.get_image_features,
+                config.models["image"].get("compile", False)
+            )
+        self.batch_size = config.models["image"].get("batch_size", 8)
+        
+        # Optional on-disk cache of embeddings keyed by image bytes and model name
+        self.cache_dir = config.models["image"].get("cache_dir")
+        if self.cache_dir:
+            os.makedirs(self.cache_dir, exist_ok=True)
         
     def extract_figures(self, page, doc) -> list:
         """Extract figures and their captions from a page."""
         figures = []
+        image_bytes = []
         
         # Get all images from the page
         for img_index, img in enumerate(page.get_images(full=True)):
@@ -20,23 +47,27 @@ class FigureExtractor:
             
             if base_image:
                 # Convert to PIL Image
-                image_bytes = base_image["image"]
-                image = Image.open(io.BytesIO(image_bytes))
+                image_bytes.append(base_image["image"])
+                image = Image.open(io.BytesIO(base_image["image"]))
                 
                 # Find caption
                 caption = self._find_figure_caption(page, img)
                 
-                # Generate image embedding
-                embedding = self._generate_image_embedding(image)
-                
                 figures.append({
                     "image": image,
                     "bbox": img[1:5],
                     "caption": caption,
-                    "embedding": embedding,
                     "page_num": page.number
                 })
                 
+        # Embed all of the page's images in batched CLIP passes
+        embeddings = self._generate_image_embeddings(
+            [figure["image"] for figure in figures],
+            image_bytes
+        )
+        for figure, embedding in zip(figures, embeddings):
+            figure["embedding"] = embedding
+            
         return figures
     
     def _find_figure_caption(self, page, img) -> str:
@@ -50,7 +81,12 @@ class FigureExtractor:
         for block in blocks:
             if block["type"] == 0:  # Text block
                 if self._is_caption_candidate(block, img_bbox):
-                    text = block["text"].strip()
+                    # "dict" blocks carry their text in lines of spans; lines are
+                    # kept apart so a keyword starting a line still has a word boundary
+                    text = "\n".join(
+                        "".join(span.get("text", "") for span in line.get("spans", []))
+                        for line in block.get("lines", [])
+                    ).strip()
                     if self._is_caption_text(text):
                         caption = text
                         break
@@ -77,18 +113,38 @@ class FigureExtractor:
     
     def _is_caption_text(self, text: str) -> bool:
         """Check if text matches caption patterns."""
-        text_lower = text.lower()
-        caption_patterns = [
-            "figure", "fig.", "fig", "image", "illustration"
-        ]
-        
-        return any(pattern in text_lower for pattern in caption_patterns)
+        return self._caption_re.search(text) is not None
     
-    def _generate_image_embedding(self, image: Image) -> torch.Tensor:
-        """Generate embedding for an image using CLIP."""
-        inputs = self.clip_processor(images=image, return_tensors="pt")
+    def _generate_image_embeddings(self, images: list, image_bytes: list) -> list:
+        """Generate CLIP embeddings for a list of images, reusing cached ones."""
+        embeddings = [None] * len(images)
+        keys = [self._cache_key(data) for data in image_bytes] if self.cache_dir else []
         
-        with torch.no_grad():
-            image_features = self.clip_model.get_image_features(**inputs)
+        for idx, key in enumerate(keys):
+            path = os.path.join(self.cache_dir, f"{key}.npy")
+            if os.path.exists(path):
+                embeddings[idx] = np.load(path)
+                
+        missing = [idx for idx, embedding in enumerate(embeddings) if embedding is None]
+        for start in range(0, len(missing), self.batch_size):
+            batch = missing[start:start + self.batch_size]
+            inputs = self.clip_processor(
+                images=[images[idx] for idx in batch],
+                return_tensors="pt"
+            ).to(self.device)
             
-        return image_features.squeeze().numpy()
\ No newline at end of file
+            with torch.no_grad(), autocast(self.device, self.dtype):
+                image_features = self._image_features(**inputs)
+                
+            for idx, embedding in zip(batch, image_features.float().cpu().numpy()):
+                embeddings[idx] = embedding
+                if self.cache_dir:
+                    np.save(os.path.join(self.cache_dir, f"{keys[idx]}.npy"), embedding)
+                    
+        return embeddings
+    
+    def _cache_key(self, data: bytes) -> str:
+        """Hash raw image bytes together with the CLIP model name."""
+        digest = hashlib.sha1(self.config.models["image"]["name"].encode("utf-8"))
+        digest.update(data)
+        return digest.hexdigest()
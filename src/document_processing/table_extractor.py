@@ -3,16 +3,32 @@ import pandas as pd
 from PIL import Image
 import torch
 from transformers import AutoModelForObjectDetection
+from src.utils.device_utils import autocast, get_autocast_dtype, get_device, maybe_compile
+from src.utils.trt_runner import load_trt_engine
 
 class TableExtractor:
     def __init__(self, config):
         self.config = config
+        self.device = get_device()
+        self.dtype = get_autocast_dtype(self.device)
+        # Reduced precision can corrupt structure recognition output, so it is opt-in
+        self.structure_autocast = config.models["table_structure"].get("autocast", False)
+        
         self.detector = AutoModelForObjectDetection.from_pretrained(
             config.models["table_detection"]["name"]
-        )
+        ).to(self.device).eval()
         self.structure_recognizer = AutoModelForObjectDetection.from_pretrained(
             config.models["table_structure"]["name"]
-        )
+        ).to(self.device).eval()
+        # Structure labels indexable by class id, for bulk decoding on the CPU
+        id2label = self.structure_recognizer.config.id2label
+        self._struct_id2label = [id2label[i] for i in range(len(id2label))]
+        # Forward passes, served by a TensorRT engine or torch.compile when configured;
+        # the models themselves keep their processors and configs
+        self._detect = (load_trt_engine(config.models["table_detection"].get("trt_engine_path"))
+                        or maybe_compile(self.detector, config.models["table_detection"].get("compile", False)))
+        self._recognize = (load_trt_engine(config.models["table_structure"].get("trt_engine_path"))
+                           or maybe_compile(self.structure_recognizer, config.models["table_structure"].get("compile", False)))
         
     def extract_tables(self, page_image: Image) -> list:
         """Extract tables from a page image."""
@@ -46,26 +62,22 @@ class TableExtractor:
     def _detect_tables(self, image: Image) -> torch.Tensor:
         """Detect table regions in the image."""
         # Prepare image for the model
-        inputs = self.detector.processor(images=image, return_tensors="pt")
+        inputs = self.detector.processor(images=image, return_tensors="pt").to(self.device)
         
         # Get predictions
-        with torch.no_grad():
-            outputs = self.detector(**inputs)
+        with torch.no_grad(), autocast(self.device, self.dtype):
+            outputs = self._detect(**inputs)
         
-        # Filter predictions by confidence
-        confident_detections = []
-        for score, label, box in zip(outputs.scores, outputs.labels, outputs.boxes):
-            if score > self.config.models["table_detection"]["confidence_threshold"]:
-                confident_detections.append(box)
-                
-        return torch.stack(confident_detections) if confident_detections else torch.tensor([])
+        # Filter predictions by confidence in one masked selection
+        confident = outputs.scores > self.config.models["table_detection"]["confidence_threshold"]
+        return outputs.boxes[confident]
     
     def _recognize_structure(self, table_image: Image) -> dict:
         """Recognize the structure of a table region."""
-        inputs = self.structure_recognizer.processor(images=table_image, return_tensors="pt")
+        inputs = self.structure_recognizer.processor(images=table_image, return_tensors="pt").to(self.device)
         
-        with torch.no_grad():
-            outputs = self.structure_recognizer(**inputs)
+        with torch.no_grad(), autocast(self.device, self.dtype, enabled=self.structure_autocast):
+            outputs = self._recognize(**inputs)
             
         return self._process_structure_outputs(outputs)
     
@@ -75,14 +87,14 @@ class TableExtractor:
         rows = []
         cols = []
         
-        # Process detected cells and their relationships
-        for score, label, box in zip(outputs.scores, outputs.labels, outputs.boxes):
-            if score > self.config.models["table_detection"]["confidence_threshold"]:
-                cell_type = self.structure_recognizer.config.id2label[label.item()]
-                cells.append({
-                    "bbox": box.tolist(),
-                    "type": cell_type
-                })
+        # Process detected cells and their relationships; predictions are
+        # copied to the CPU once rather than synced per element with .item()
+        confident = outputs.scores > self.config.models["table_detection"]["confidence_threshold"]
+        for label, box in zip(outputs.labels[confident].tolist(), outputs.boxes[confident].tolist()):
+            cells.append({
+                "bbox": box,
+                "type": self._struct_id2label[label]
+            })
                 
         return {
             "cells": cells,
@@ -1,135 +1,229 @@
 from transformers import AutoTokenizer, AutoModelForTokenClassification
 import torch
-import spacy
+import numpy as np
 from typing import List, Dict, Tuple
 import re
+import hashlib
+from src.chunking.chunk_utils import Chunk
+from src.utils.device_utils import autocast, get_autocast_dtype, get_device, maybe_compile
+
+try:
+    import numba
+except ImportError:  # Optional; the pure Python sweep below is used instead
+    numba = None
+
+try:
+    import xxhash
+except ImportError:  # Optional; blake2b is used instead
+    xxhash = None
+
+
+def _hash_key(key: str) -> int:
+    """Hash a string to an unsigned 64-bit integer."""
+    if xxhash is not None:
+        return xxhash.xxh64_intdigest(key)
+    return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def _resolve_overlaps_python(starts, lengths, order):
+    """Sweep spans in start order, keeping the longer of each overlapping pair.
+    
+    Returns the indices of the kept spans in start order.
+    """
+    keep = []
+    current = order[0]
+    for idx in order[1:]:
+        # If there's no overlap, keep current and move to next
+        if starts[idx] >= starts[current] + lengths[current]:
+            keep.append(current)
+            current = idx
+        elif lengths[idx] > lengths[current]:
+            current = idx
+    keep.append(current)
+    return keep
+
+
+if numba is not None:
+    @numba.njit(cache=True)
+    def _resolve_overlaps_numba(starts, lengths, order):
+        """Numba version of _resolve_overlaps_python."""
+        keep = np.empty(len(order), dtype=np.int64)
+        count = 0
+        current = order[0]
+        for k in range(1, len(order)):
+            idx = order[k]
+            if starts[idx] >= starts[current] + lengths[current]:
+                keep[count] = current
+                count += 1
+                current = idx
+            elif lengths[idx] > lengths[current]:
+                current = idx
+        keep[count] = current
+        return keep[:count + 1]
+
 
 class EntityExtractor:
     def __init__(self, config):
         self.config = config
-        self.tokenizer = AutoTokenizer.from_pretrained("jean-baptiste/roberta-large-ner-english")
-        self.model = AutoModelForTokenClassification.from_pretrained("jean-baptiste/roberta-large-ner-english")
-        self.nlp = spacy.load("en_core_web_sm")
+        self.device = get_device()
+        self.dtype = get_autocast_dtype(self.device)
+        ner_config = config.get("models", {}).get("ner", {}) if isinstance(config, dict) else {}
+        ner_model = ner_config.get("name", "jean-baptiste/roberta-large-ner-english")
+        self.tokenizer = AutoTokenizer.from_pretrained(ner_model)
+        self.model = AutoModelForTokenClassification.from_pretrained(ner_model).to(self.device).eval()
+        self._forward = maybe_compile(self.model, ner_config.get("compile", False))
+        self.batch_size = ner_config.get("batch_size", 16)
+        
+        # Label lookup tables indexed by predicted class id
+        id2label = self.model.config.id2label
+        self._label_arr = np.array([id2label[i] for i in range(len(id2label))])
+        self._is_b = np.char.startswith(self._label_arr, "B-")
+        self._is_i = np.char.startswith(self._label_arr, "I-")
+        
+        # Technical entity patterns unioned into one regex so each text is
+        # scanned once; URL and FUNCTION come before CONSTANT, which would
+        # otherwise claim their leading word. The scan is leftmost-first, so a
+        # CLASS name may not start a URL or it would cut the URL short
+        self._tech_re = re.compile(
+            r"(?P<URL>\b(?:https?://|www\.)[^\s]+)"
+            r"|(?P<CLASS>\b(?:class|interface)\s+(?!https?://|www\.)[A-Z][a-zA-Z0-9_]*)"
+            r"|(?P<FUNCTION>\b[a-z_][a-z0-9_]*\([^)]*\))"
+            r"|(?P<CONSTANT>\b[A-Z][A-Z0-9_]*\b)",
+            re.IGNORECASE
+        )
         self._entity_counter = 0  # Add counter for generating unique IDs
     
-    def _generate_entity_id(self) -> str:
-        """Generate a unique entity ID."""
-        self._entity_counter += 1
-        return f"entity_{self._entity_counter}"
+    def _assign_entity_ids(self, entities: List[Dict]) -> List[Dict]:
+        """Give each entity a unique ID, continuing the counter across calls."""
+        ids = np.arange(self._entity_counter + 1, self._entity_counter + 1 + len(entities))
+        self._entity_counter += len(entities)
+        for entity, entity_id in zip(entities, ids.tolist()):
+            entity["id"] = f"entity_{entity_id}"
+        return entities
 
-    def extract_entities(self, chunks: List[Dict]) -> List[Dict]:
+    def extract_entities(self, chunks: List[Chunk]) -> List[Dict]:
         """Extract entities from document chunks."""
         entities = []
         
-        for chunk in chunks:
-            # Extract named entities
-            named_entities = self._extract_named_entities(chunk["text"])
-            
+        # Extract named entities for all chunks in batched forward passes
+        texts = [chunk.text for chunk in chunks]
+        named_entities = self._extract_named_entities(texts)
+        
+        for chunk, chunk_named_entities in zip(chunks, named_entities):
             # Extract technical entities
-            technical_entities = self._extract_technical_entities(chunk["text"])
+            technical_entities = self._extract_technical_entities(chunk.text)
             
             # Merge and deduplicate entities
-            chunk_entities = self._merge_entities(named_entities, technical_entities)
+            chunk_entities = self._merge_entities(chunk_named_entities, technical_entities)
             
-            # Add chunk reference and entity ID
+            # Add chunk reference
             for entity in chunk_entities:
-                entity["chunk_id"] = chunk["id"]
-                entity["id"] = self._generate_entity_id()  # Add unique ID
+                entity["chunk_id"] = chunk.id
                 entities.append(entity)
                 
-        return self._deduplicate_entities(entities)
+        # Number only the entities that survive deduplication
+        return self._assign_entity_ids(self._deduplicate_entities(entities))
     
-    def _extract_named_entities(self, text: str) -> List[Dict]:
-        """Extract named entities using RoBERTa model."""
-        entities = []
-        inputs = self.tokenizer(text, return_tensors="pt", truncation=True, max_length=512)
+    def _extract_named_entities(self, texts: List[str]) -> List[List[Dict]]:
+        """Extract named entities using RoBERTa model, one list per text."""
+        results = []
         
-        with torch.no_grad():
-            outputs = self.model(**inputs)
-            predictions = outputs.logits.argmax(-1)
+        for batch_start in range(0, len(texts), self.batch_size):
+            batch = texts[batch_start:batch_start + self.batch_size]
+            inputs = self.tokenizer(
+                batch,
+                return_tensors="pt",
+                padding=True,
+                truncation=True,
+                max_length=512,
+                return_offsets_mapping=True,
+                return_special_tokens_mask=True
+            )
+            # Character offsets of each token in its source text
+            offsets = inputs.pop("offset_mapping").tolist()
+            special = inputs.pop("special_tokens_mask").numpy().astype(bool)
+            inputs = inputs.to(self.device)
             
-        tokens = self.tokenizer.convert_ids_to_tokens(inputs["input_ids"][0])
-        current_entity = {"text": "", "type": "", "start": 0}
-        
-        for idx, (token, pred) in enumerate(zip(tokens, predictions[0])):
-            entity_label = self.model.config.id2label[pred.item()]
-            
-            if entity_label.startswith("B-"):
-                if current_entity["text"]:
-                    entities.append(current_entity.copy())
-                current_entity = {
-                    "text": token,
-                    "type": entity_label[2:],
-                    "start": idx
-                }
-            elif entity_label.startswith("I-") and current_entity["text"]:
-                current_entity["text"] += " " + token
+            with torch.no_grad(), autocast(self.device, self.dtype):
+                outputs = self._forward(**inputs)
+                predictions = outputs.logits.argmax(-1)
                 
-        if current_entity["text"]:
-            entities.append(current_entity)
+            predictions = predictions.cpu().numpy()
+            lengths = inputs["attention_mask"].sum(dim=1).tolist()
             
-        return entities
+            for row, (text, length) in enumerate(zip(batch, lengths)):
+                # Drop padding before decoding the row
+                results.append(self._decode_entities(
+                    text, offsets[row][:length], predictions[row, :length], special[row, :length]
+                ))
+                
+        return results
     
-    def _extract_technical_entities(self, text: str) -> List[Dict]:
-        """Extract technical entities using spaCy and custom patterns."""
-        doc = self.nlp(text)
+    def _decode_entities(self, text: str, offsets: List[List[int]], preds: np.ndarray, special: np.ndarray) -> List[Dict]:
+        """Group B-/I- token predictions into entity spans of the source text."""
         entities = []
         
-        # Custom patterns for technical entities
-        patterns = [
-            (r"(?i)\b[a-z_][a-z0-9_]*\([^)]*\)", "FUNCTION"),
-            (r"(?i)\b(class|interface)\s+[A-Z][a-zA-Z0-9_]*", "CLASS"),
-            (r"(?i)\b[A-Z][A-Z0-9_]*\b", "CONSTANT"),
-            (r"(?i)\b(https?://|www\.)[^\s]+", "URL")
-        ]
+        # An entity starts at a B- token and runs over the I- tokens after it;
+        # special tokens such as </s> carry no text, so they always end a run
+        starts = np.flatnonzero(self._is_b[preds] & ~special)
+        breaks = np.append(np.flatnonzero(~self._is_i[preds] | special), len(preds))
+        ends = breaks[np.searchsorted(breaks, starts, side="right")]
         
-        # Extract using patterns
-        for pattern, entity_type in patterns:
-            for match in re.finditer(pattern, text):
+        for start, end in zip(starts.tolist(), ends.tolist()):
+            char_start, char_end = offsets[start][0], offsets[end - 1][1]
+            if char_end > char_start:
                 entities.append({
-                    "text": match.group(),
-                    "type": entity_type,
-                    "start": match.start()
+                    "text": text[char_start:char_end],
+                    "type": str(self._label_arr[preds[start]])[2:],
+                    "start": char_start
                 })
                 
         return entities
     
+    def _extract_technical_entities(self, text: str) -> List[Dict]:
+        """Extract technical entities using custom patterns."""
+        entities = []
+        
+        # Extract using the combined technical entity pattern
+        for match in self._tech_re.finditer(text):
+            entities.append({
+                "text": match.group(),
+                "type": match.lastgroup,
+                "start": match.start()
+            })
+                
+        return entities
+    
     def _merge_entities(self, named_entities: List[Dict], technical_entities: List[Dict]) -> List[Dict]:
         """Merge named entities and technical entities, handling overlaps."""
         merged = named_entities + technical_entities
-        # Sort by start position to handle overlaps
-        merged.sort(key=lambda x: x["start"])
-        
-        # Remove overlapping entities, keeping the longer one
-        result = []
         if not merged:
-            return result
+            return []
             
-        current = merged[0]
-        for next_entity in merged[1:]:
-            current_end = current["start"] + len(current["text"])
-            # If there's no overlap, add current to result and move to next
-            if next_entity["start"] >= current_end:
-                result.append(current)
-                current = next_entity
-            else:
-                # If there's overlap, keep the longer entity
-                if len(next_entity["text"]) > len(current["text"]):
-                    current = next_entity
+        # Sort spans by start position to handle overlaps
+        starts = np.array([entity["start"] for entity in merged], dtype=np.int64)
+        lengths = np.array([len(entity["text"]) for entity in merged], dtype=np.int64)
+        order = np.argsort(starts, kind="stable")
         
-        result.append(current)
-        return result
+        # Remove overlapping entities, keeping the longer one
+        if numba is not None:
+            keep = _resolve_overlaps_numba(starts, lengths, order).tolist()
+        else:
+            keep = _resolve_overlaps_python(starts.tolist(), lengths.tolist(), order.tolist())
+        return [merged[idx] for idx in keep]
     
     def _deduplicate_entities(self, entities: List[Dict]) -> List[Dict]:
         """Remove duplicate entities across chunks."""
-        seen = set()
-        unique_entities = []
+        if not entities:
+            return []
+            
+        # Identifying features (lowercased text and type) hashed into one integer column
+        keys = np.fromiter(
+            (_hash_key(entity["text"].lower() + "\x00" + entity["type"]) for entity in entities),
+            dtype=np.uint64,
+            count=len(entities)
+        )
         
-        for entity in entities:
-            # Create a tuple of identifying features
-            entity_key = (entity["text"].lower(), entity["type"])
-            if entity_key not in seen:
-                seen.add(entity_key)
-                unique_entities.append(entity)
-                
-        return unique_entities
\ No newline at end of file
+        # First occurrence of each key, kept in original order
+        _, first = np.unique(keys, return_index=True)
+        return [entities[idx] for idx in np.sort(first).tolist()]
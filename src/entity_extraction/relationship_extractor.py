@@ -1,41 +1,84 @@
 import spacy
+from spacy.tokens import Doc
+import numpy as np
 import networkx as nx
 from typing import List, Dict, Tuple
+from src.chunking.chunk_utils import Chunk
+
+try:
+    import numba
+except ImportError:  # Optional; the NumPy version below is used instead
+    numba = None
+
+
+def _window_pairs_numpy(positions, window):
+    """Pair each sorted token position with the later ones at most window tokens away."""
+    window_ends = np.searchsorted(positions, positions + window, side="right")
+    counts = window_ends - np.arange(1, len(positions) + 1)
+    first = np.repeat(np.arange(len(positions)), counts)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    return positions[first], positions[first + 1 + offsets]
+
+
+if numba is not None:
+    @numba.njit(parallel=True, cache=True)
+    def _window_pairs_numba(positions, window):
+        """Numba version of _window_pairs_numpy: count pairs, then fill them in parallel."""
+        n = len(positions)
+        counts = np.zeros(n, dtype=np.int64)
+        for k in numba.prange(n):
+            m = k + 1
+            while m < n and positions[m] - positions[k] <= window:
+                m += 1
+            counts[k] = m - k - 1
+            
+        offsets = np.zeros(n + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(counts)
+        sources = np.empty(offsets[n], dtype=np.int64)
+        targets = np.empty(offsets[n], dtype=np.int64)
+        for k in numba.prange(n):
+            for c in range(counts[k]):
+                sources[offsets[k] + c] = positions[k]
+                targets[offsets[k] + c] = positions[k + 1 + c]
+        return sources, targets
+        
+    _window_pairs = _window_pairs_numba
+else:
+    _window_pairs = _window_pairs_numpy
+
 
 class RelationshipExtractor:
     def __init__(self, config):
         self.config = config
-        self.nlp = spacy.load("en_core_web_sm")
+        # Only the parser and POS tags are used; skip NER and lemmatization
+        self.nlp = spacy.load("en_core_web_sm", disable=["ner", "lemmatizer"])
         
-    def extract_relationships(self, entities: List[Dict], chunks: List[Dict]) -> List[Dict]:
+        relationship_config = config.get("relationship_extraction", {})
+        self.spacy_batch_size = relationship_config.get("spacy_batch_size", 64)
+        self.spacy_n_process = relationship_config.get("spacy_n_process", 1)
+        
+    def extract_relationships(self, entities: List[Dict], chunks: List[Chunk]) -> List[Dict]:
         """Extract relationships between entities."""
         relationships = []
         
         # Build entity index for efficient lookup
         entity_index = self._build_entity_index(entities)
         
-        for chunk in chunks:
+        # Parse all chunks in one pass; both extractors share each Doc
+        docs = self.nlp.pipe(
+            (chunk.text for chunk in chunks),
+            batch_size=self.spacy_batch_size,
+            n_process=self.spacy_n_process
+        )
+        
+        for doc in docs:
             # Extract syntactic relationships
-            syntactic_rels = self._extract_syntactic_relationships(
-                chunk["text"],
-                entity_index
-            )
+            syntactic_rels = self._extract_syntactic_relationships(doc, entity_index)
             relationships.extend(syntactic_rels)
             
             # Extract semantic relationships
-            semantic_rels = self._extract_semantic_relationships(
-                chunk["text"],
-                entity_index
-            )
+            semantic_rels = self._extract_semantic_relationships(doc, entity_index)
             relationships.extend(semantic_rels)
-            
-            # Extract cross-modal relationships
-            if "tables" in chunk or "figures" in chunk:
-                cross_modal_rels = self._extract_cross_modal_relationships(
-                    chunk,
-                    entity_index
-                )
-                relationships.extend(cross_modal_rels)
                 
         return self._deduplicate_relationships(relationships)
     
@@ -49,10 +92,9 @@ class RelationshipExtractor:
             index[key].append(entity)
         return index
     
-    def _extract_syntactic_relationships(self, text: str, entity_index: Dict) -> List[Dict]:
+    def _extract_syntactic_relationships(self, doc: Doc, entity_index: Dict) -> List[Dict]:
         """Extract relationships based on syntactic patterns."""
         relationships = []
-        doc = self.nlp(text)
         
         for sent in doc.sents:
             # Extract subject-verb-object relationships
@@ -77,32 +119,32 @@ class RelationshipExtractor:
                                 
         return relationships
     
-    def _extract_semantic_relationships(self, text: str, entity_index: Dict) -> List[Dict]:
+    def _extract_semantic_relationships(self, doc: Doc, entity_index: Dict) -> List[Dict]:
         """Extract relationships based on semantic patterns and co-occurrence."""
         relationships = []
-        doc = self.nlp(text)
         
         # Window-based co-occurrence
         window_size = 5
-        tokens = [token.text.lower() for token in doc]
+        tokens = np.array([token.text.lower() for token in doc], dtype=str)
+        entity_pos = np.flatnonzero(np.isin(tokens, list(entity_index)))
         
-        for i, token in enumerate(tokens):
-            if token in entity_index:
-                window_start = max(0, i - window_size)
-                window_end = min(len(tokens), i + window_size + 1)
-                
-                for j in range(window_start, window_end):
-                    if i != j and tokens[j] in entity_index:
-                        # Calculate co-occurrence strength
-                        distance = abs(i - j)
-                        strength = 1.0 - (distance / window_size)
-                        
-                        relationships.append({
-                            "source": entity_index[token][0]["id"],
-                            "target": entity_index[tokens[j]][0]["id"],
-                            "type": "co-occurs",
-                            "confidence": strength
-                        })
+        # Pair each entity token with the later entity tokens in its window
+        source_pos, target_pos = _window_pairs(entity_pos.astype(np.int64), window_size)
+        
+        # Calculate co-occurrence strength
+        strengths = 1.0 - (target_pos - source_pos) / window_size
+        
+        # Co-occurrence is symmetric, so each pair becomes an edge in both directions
+        for i, j, strength in zip(source_pos.tolist(), target_pos.tolist(), strengths.tolist()):
+            first = entity_index[tokens[i]][0]["id"]
+            second = entity_index[tokens[j]][0]["id"]
+            for source, target in ((first, second), (second, first)):
+                relationships.append({
+                    "source": source,
+                    "target": target,
+                    "type": "co-occurs",
+                    "confidence": strength
+                })
                         
         return relationships
     
@@ -1,18 +1,68 @@
 import networkx as nx
-from sentence_transformers import SentenceTransformer
-from transformers import CLIPProcessor, CLIPModel
+import numpy as np
+import logging
+import os
+import pickle
+import functools
+import torch
+from torch.utils.data import DataLoader, Dataset
+from src.utils.device_utils import autocast, get_autocast_dtype, get_device
+from src.utils.model_registry import get_clip_model, get_clip_processor, get_sentence_transformer
+
+class _ImageDataset(Dataset):
+    """Figure images preprocessed for CLIP one at a time inside DataLoader workers."""
+    
+    def __init__(self, images, processor):
+        self.images = images
+        self.processor = processor
+        
+    def __len__(self):
+        return len(self.images)
+    
+    def __getitem__(self, idx):
+        return self.processor(images=self.images[idx], return_tensors="pt")["pixel_values"][0]
+
 
 class KnowledgeGraphBuilder:
     def __init__(self, config):
         self.config = config.get("models", {}) if isinstance(config, dict) else config
+        embedding_config = config.get("embedding", {}) if isinstance(config, dict) else {}
+        self.embedding_dim = embedding_config.get("text_dimension", 768)
+        self.image_embedding_dim = embedding_config.get("image_dimension", 512)
+        # Node embeddings are stored unit-length in this dtype; float16 halves
+        # graph memory and the bytes scanned per query
+        self.storage_dtype = np.dtype(embedding_config.get("storage_dtype", "float16"))
         
         # Access model names with defaults
         text_model = self.config.get("text_embedding", {}).get("name", "sentence-transformers/all-mpnet-base-v2")
         image_model = self.config.get("image", {}).get("name", "openai/clip-vit-base-patch32")
         
-        self.text_embedder = SentenceTransformer(text_model)
-        self.image_processor = CLIPProcessor.from_pretrained(image_model)
-        self.image_model = CLIPModel.from_pretrained(image_model)
+        self.device = get_device()
+        self.dtype = get_autocast_dtype(self.device)
+        # Models come from the shared registry, so the retriever reuses the same instances
+        self.text_embedder = get_sentence_transformer(text_model, self.device)
+        self.text_batch_size = self.config.get("text_embedding", {}).get("batch_size", 64)
+        self.image_model_name = image_model
+        self.image_batch_size = self.config.get("image", {}).get("batch_size", 8)
+        self.image_num_workers = self.config.get("image", {}).get("num_workers", 0)
+        
+        # Entity embeddings keyed by (text, entity type), reused across nodes
+        # and builds; persisted per model when a cache directory is configured
+        cache_dir = self.config.get("text_embedding", {}).get("entity_cache_dir")
+        self._entity_cache_path = (
+            os.path.join(cache_dir, f"{text_model.replace('/', '__')}.pkl") if cache_dir else None
+        )
+        self._entity_emb_cache = self._load_entity_cache()
+        
+    @functools.cached_property
+    def image_processor(self):
+        """CLIP processor, loaded on first use since only figure nodes need it."""
+        return get_clip_processor(self.image_model_name)
+        
+    @functools.cached_property
+    def image_model(self):
+        """CLIP weights, loaded on first use since only figure nodes need them."""
+        return get_clip_model(self.image_model_name, self.device)
         
     def build_graph(self, chunks, entities, relationships=None):
         """Build knowledge graph from document elements."""
@@ -37,10 +87,10 @@ class KnowledgeGraphBuilder:
         """Add document chunks as nodes."""
         for chunk in chunks:
             graph.add_node(
-                f"chunk_{chunk['id']}", 
+                f"chunk_{chunk.id}", 
                 type="chunk",
-                content=chunk["text"],
-                metadata=chunk["metadata"]
+                content=chunk.text,
+                metadata=chunk.metadata
             )
             
     def _add_entity_nodes(self, graph, entities):
@@ -77,45 +127,127 @@ class KnowledgeGraphBuilder:
             
     def _generate_embeddings(self, graph):
         """Generate embeddings for different node types."""
-        embedding_dim = self.config.get("embedding", {}).get("text_dimension", 768)
+        text_nodes, texts = [], []
+        image_nodes, images = [], []
+        entity_nodes = []
         
+        # Collect node contents so each model runs once over a batch
         for node, data in graph.nodes(data=True):
             content = data.get("content", "")
             
+            # Figure chunks get a CLIP embedding of their image, even without a caption
+            image = data.get("metadata", {}).get("image") if data["type"] == "chunk" else None
+            if image is not None:
+                image_nodes.append(node)
+                images.append(image)
+                
             if not content:
                 continue
                 
-            try:
-                if data["type"] in ["chunk", "entity", "text"]:
-                    embedding = self.text_embedder.encode(content)
-                elif data["type"] == "table":
-                    embedding = self._generate_table_embedding(content)
-                elif data["type"] == "figure":
-                    embedding = self._generate_image_embedding(content)
-                else:
-                    embedding = self.text_embedder.encode(str(content))
+            if data["type"] == "entity":
+                entity_nodes.append((node, (content, data.get("entity_type", ""))))
+            elif data["type"] in ["chunk", "text"]:
+                text_nodes.append(node)
+                texts.append(content)
+            elif data["type"] == "table":
+                text_nodes.append(node)
+                texts.append(self._table_to_text(content))
+            elif data["type"] == "figure":
+                image_nodes.append(node)
+                images.append(content)
+            else:
+                text_nodes.append(node)
+                texts.append(str(content))
                 
+        # Entities sharing a surface form and type are encoded once
+        missing = list(dict.fromkeys(key for _, key in entity_nodes if key not in self._entity_emb_cache))
+        texts.extend(text for text, _ in missing)
+        
+        embedded = []
+        try:
+            if texts:
+                text_embeddings = self.text_embedder.encode(
+                    texts,
+                    batch_size=self.text_batch_size,
+                    convert_to_numpy=True,
+                    show_progress_bar=False
+                )
+                embedded.extend(zip(text_nodes, text_embeddings))
+                # Copy so cached rows do not keep this build's whole batch matrix alive
+                self._entity_emb_cache.update(zip(missing, text_embeddings[len(text_nodes):].copy()))
+                if missing:
+                    self._save_entity_cache()
+        except Exception as e:
+            logging.error(f"Error generating text embeddings: {str(e)}")
+        embedded.extend(
+            (node, self._entity_emb_cache[key]) for node, key in entity_nodes if key in self._entity_emb_cache
+        )
+        
+        image_embedded = []
+        try:
+            if images:
+                image_embedded = list(zip(image_nodes, self._generate_image_embeddings(images)))
+        except Exception as e:
+            logging.error(f"Error generating image embeddings: {str(e)}")
+            
+        # Text vectors feed retrieval under "embedding"; CLIP vectors live in their
+        # own space and are kept apart under "image_embedding"
+        for attribute, dim, pairs in (
+            ("embedding", self.embedding_dim, embedded),
+            ("image_embedding", self.image_embedding_dim, image_embedded)
+        ):
+            for node, embedding in pairs:
                 # Ensure consistent dimensions
-                if len(embedding) != embedding_dim:
+                if len(embedding) != dim:
                     logging.warning(f"Embedding dimension mismatch for node {node}. Skipping.")
                     continue
                     
-                graph.nodes[node]["embedding"] = embedding
-            except Exception as e:
-                logging.error(f"Error generating embedding for node {node}: {str(e)}")
-                continue
+                graph.nodes[node][attribute] = self._to_storage(embedding)
                 
-    def _generate_table_embedding(self, table_content):
-        """Generate embedding for table content."""
-        # Convert table content to string representation
-        table_text = self._table_to_text(table_content)
-        return self.text_embedder.encode(table_text)
-        
-    def _generate_image_embedding(self, image):
-        """Generate embedding for image using CLIP."""
-        inputs = self.image_processor(images=image, return_tensors="pt")
-        outputs = self.image_model.get_image_features(**inputs)
-        return outputs.squeeze().detach().numpy()
+    def _load_entity_cache(self):
+        """Load persisted entity embeddings, or start an empty cache."""
+        if self._entity_cache_path and os.path.exists(self._entity_cache_path):
+            try:
+                with open(self._entity_cache_path, "rb") as f:
+                    return pickle.load(f)
+            except Exception as e:
+                logging.warning(f"Could not load entity embedding cache {self._entity_cache_path}: {str(e)}")
+        return {}
+        
+    def _save_entity_cache(self):
+        """Persist entity embeddings, replacing the cache file atomically."""
+        if not self._entity_cache_path:
+            return
+        os.makedirs(os.path.dirname(self._entity_cache_path), exist_ok=True)
+        tmp_path = f"{self._entity_cache_path}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(self._entity_emb_cache, f)
+        os.replace(tmp_path, self._entity_cache_path)
+        
+    def _to_storage(self, embedding):
+        """L2-normalize an embedding and cast it to the storage dtype."""
+        embedding = np.asarray(embedding, dtype=np.float32)
+        embedding = embedding / (np.linalg.norm(embedding) + 1e-12)
+        return embedding.astype(self.storage_dtype)
+        
+    def _generate_image_embeddings(self, images):
+        """Generate embeddings for images using CLIP, in batches."""
+        # Never start more workers than there are batches to preprocess
+        num_batches = -(-len(images) // self.image_batch_size)
+        loader = DataLoader(
+            _ImageDataset(images, self.image_processor),
+            batch_size=self.image_batch_size,
+            num_workers=min(self.image_num_workers, num_batches),
+            pin_memory=self.device == "cuda"
+        )
+        
+        embeddings = []
+        for pixel_values in loader:
+            pixel_values = pixel_values.to(self.device, non_blocking=True)
+            with torch.inference_mode(), autocast(self.device, self.dtype):
+                outputs = self.image_model.get_image_features(pixel_values=pixel_values)
+            embeddings.extend(outputs.float().cpu().numpy())
+        return embeddings
         
     def _table_to_text(self, table_content):
         """Convert table content to text representation."""
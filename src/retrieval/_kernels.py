@@ -0,0 +1,38 @@
+import numpy as np
+
+try:
+    import simsimd
+except ImportError:  # Optional SIMD kernels; float16 matrices are upcast for NumPy instead
+    simsimd = None
+
+
+def scan_dtype(dtype) -> np.dtype:
+    """dtype an embedding matrix should be scanned in: float16 only when simsimd can read it."""
+    return np.dtype(np.float16) if simsimd is not None and dtype == np.float16 else np.dtype(np.float32)
+
+
+def score_cosine(query: np.ndarray, matrix: np.ndarray, norms: np.ndarray = None) -> np.ndarray:
+    """Cosine similarity of a unit-length query against every row of matrix.
+    
+    Rows are taken to be unit-length unless their norms are passed.
+    """
+    query = np.asarray(query, dtype=np.float32)
+    if matrix.dtype == np.float16 and simsimd is not None:
+        # Half-precision scan with simsimd's SIMD kernels
+        distances = simsimd.cdist(query.astype(np.float16)[None, :], matrix, metric="cosine")
+        return 1.0 - np.asarray(distances, dtype=np.float32)[0]
+        
+    # One matrix-vector product over all rows
+    scores = matrix.astype(np.float32, copy=False) @ query
+    if norms is not None:
+        scores /= norms * np.linalg.norm(query) + 1e-12
+    return scores
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k highest scores, best first, without sorting the rest."""
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    top = np.argpartition(scores, -k)[-k:]
+    return top[np.argsort(scores[top])[::-1]]
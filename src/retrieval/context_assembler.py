@@ -1,11 +1,18 @@
 from typing import List, Dict
 import networkx as nx
 import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
+from src.utils.embedding_utils import cosine_similarity
+from src.utils.model_registry import get_tokenizer
 
 class ContextAssembler:
     def __init__(self, config):
         self.config = config
+        model_name = (config.get("models", {})
+                      .get("text_embedding", {})
+                      .get("name", "sentence-transformers/all-mpnet-base-v2"))
+        self.tokenizer = get_tokenizer(model_name)
+        # Approximate counts (~4 characters per token) skip the tokenizer entirely
+        self.fast_token_count = config.get("retrieval", {}).get("context_assembly", {}).get("fast_token_count", False)
         
     def assemble_context(self, 
                         retrieved_nodes: List[str],
@@ -93,15 +100,12 @@ class ContextAssembler:
             "total_tokens": 0
         }
         
-        # Add text chunks first
-        remaining_tokens = max_tokens
-        for node in grouped_nodes["text"]:
-            tokens = self._count_tokens(node["content"])
-            if remaining_tokens >= tokens:
-                context["text"].append(node["content"])
-                remaining_tokens -= tokens
-            else:
-                break
+        # Add text chunks first, in order, up to the first one that no longer fits
+        texts = [node["content"] for node in grouped_nodes["text"]]
+        cumulative = np.cumsum(np.asarray(self._count_tokens(texts), dtype=np.int64))
+        count = int(np.searchsorted(cumulative, max_tokens, side="right"))
+        context["text"] = texts[:count]
+        remaining_tokens = max_tokens - (int(cumulative[count - 1]) if count else 0)
                 
         # Add tables and figures
         for table in grouped_nodes["table"][:2]:  # Limit to 2 most relevant tables
@@ -125,6 +129,14 @@ class ContextAssembler:
         context["total_tokens"] = max_tokens - remaining_tokens
         return context
     
-    def _count_tokens(self, text: str) -> int:
-        """Count tokens in text using model's tokenizer."""
-        return len(self.tokenizer.encode(text))
\ No newline at end of file
+    def _count_tokens(self, texts: List[str]) -> List[int]:
+        """Count tokens in each text with one batched tokenizer call."""
+        if not texts:
+            return []
+        if self.fast_token_count:
+            return [max(1, len(text) // 4) for text in texts]
+        return self.tokenizer(
+            texts,
+            return_length=True,
+            return_attention_mask=False
+        )["length"]
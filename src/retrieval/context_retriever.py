@@ -1,22 +1,47 @@
 import numpy as np
-from scipy.spatial.distance import cosine
-from sentence_transformers import SentenceTransformer
 import torch
 import logging
+import functools
+import itertools
+from src.utils.device_utils import get_device
+from src.utils.embedding_utils import normalize_embedding
+from src.utils.model_registry import get_sentence_transformer
+from src.retrieval import _kernels
 
 class ContextAwareRetriever:
     def __init__(self, knowledge_graph, config):
         self.knowledge_graph = knowledge_graph
         self.config = config
         # Use the same model as used in graph building
-        embedding_model = (config.get("models", {})
-                         .get("text_embedding", {})
-                         .get("name", "sentence-transformers/all-mpnet-base-v2"))
-        self.embedder = SentenceTransformer(embedding_model)
+        self.embedding_model = (config.get("models", {})
+                              .get("text_embedding", {})
+                              .get("name", "sentence-transformers/all-mpnet-base-v2"))
+        
+        # Recent query embeddings, so repeated queries skip the encoder
+        query_cache_size = config.get("retrieval", {}).get("query_cache_size", 512)
+        self._encode_query = functools.lru_cache(maxsize=query_cache_size)(self._encode_query_impl)
+        
+        # Node embeddings stacked into one (N, D) matrix for vector search,
+        # built on first use and rebuilt when the graph's node count changes
+        # Rows have unit L2 norm, so cosine similarity is a plain dot product
+        # with a normalized query
+        self._embedding_matrix = None
+        self._node_ids = []
+        self._node_index = {}
+        self._out_degrees = None
+        # Successor lists between indexed nodes in CSR form (indptr, indices)
+        self._adj_indptr = None
+        self._adj_indices = None
+        self._index_node_count = None
+        
+    @functools.cached_property
+    def embedder(self):
+        """Query encoder, shared with the graph builder when the model matches."""
+        return get_sentence_transformer(self.embedding_model, get_device())
         
     def retrieve(self, query, top_k=5):
         """Retrieve relevant context using hybrid search."""
-        query_embedding = self.embedder.encode(query)
+        query_embedding = self._encode_query(query)
         
         # Initial vector similarity search
         initial_candidates = self._vector_search(query_embedding, top_k * 2)
@@ -33,63 +58,133 @@ class ContextAwareRetriever:
         # Select top results
         return self._select_top_results(scored_candidates, top_k)
         
-    def _vector_search(self, query_embedding, k):
-        """Perform vector similarity search."""
-        similarities = []
+    def _encode_query_impl(self, query):
+        """Encode and normalize a query; cached results are shared, so made read-only."""
+        query_embedding = normalize_embedding(self.embedder.encode(query))
+        query_embedding.setflags(write=False)
+        return query_embedding
+        
+    def invalidate_index(self):
+        """Drop the cached embedding matrix and degrees, e.g. after editing embeddings or edges in place."""
+        self._embedding_matrix = None
+        
+    def _build_embedding_index(self, dim):
+        """Stack every node embedding of dimension dim into one matrix.
+        
+        float16 embeddings stay float16 when simsimd can scan them directly;
+        everything else is searched as float32. Rows are normalized once here
+        unless they already are (the graph builder stores unit vectors).
+        """
+        node_ids = []
+        embeddings = []
+        mismatched = 0
         
         for node, data in self.knowledge_graph.nodes(data=True):
             if "embedding" not in data:
                 continue
                 
-            try:
-                node_embedding = data["embedding"]
-                # Ensure embeddings have same dimensions
-                if len(query_embedding) != len(node_embedding):
-                    logging.warning(f"Embedding dimension mismatch for node {node}. "
-                                 f"Expected {len(query_embedding)}, got {len(node_embedding)}")
-                    continue
-                    
-                similarity = 1 - cosine(query_embedding, node_embedding)
-                similarities.append((node, similarity))
-            except Exception as e:
-                logging.error(f"Error computing similarity for node {node}: {str(e)}")
+            node_embedding = data["embedding"]
+            # Ensure embeddings have same dimensions; queries never re-check
+            if len(node_embedding) != dim:
+                mismatched += 1
                 continue
-                
-        return sorted(similarities, key=lambda x: x[1], reverse=True)[:k]
+            node_ids.append(node)
+            embeddings.append(node_embedding)
+            
+        if mismatched:
+            logging.warning(f"Skipped {mismatched} nodes whose embedding dimension differs "
+                            f"from the query's ({dim}).")
+            
+        self._node_ids = node_ids
+        self._node_index = {node: i for i, node in enumerate(node_ids)}
+        # Graph-based importance inputs; neighbors() of a DiGraph are its successors
+        out_degree = self.knowledge_graph.out_degree
+        self._out_degrees = np.fromiter((out_degree(node) for node in node_ids), dtype=np.float32, count=len(node_ids))
+        self._build_adjacency()
+        matrix = np.asarray(embeddings).reshape(len(embeddings), dim)
+        if _kernels.scan_dtype(matrix.dtype) == np.float32:
+            matrix = matrix.astype(np.float32)
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            if not np.allclose(norms, 1.0, atol=1e-3):
+                matrix /= norms + 1e-12
+        self._embedding_matrix = np.ascontiguousarray(matrix)
+        self._index_node_count = self.knowledge_graph.number_of_nodes()
+        
+    def _build_adjacency(self):
+        """Flatten successor links between indexed nodes into CSR arrays.
+        
+        Only indexed nodes can be scored, so links to nodes without an
+        embedding are left out.
+        """
+        successors = self.knowledge_graph.succ
+        rows = [
+            [self._node_index[n] for n in successors[node] if n in self._node_index]
+            for node in self._node_ids
+        ]
+        counts = np.fromiter(map(len, rows), dtype=np.int64, count=len(rows))
+        self._adj_indptr = np.concatenate(([0], np.cumsum(counts)))
+        self._adj_indices = np.fromiter(itertools.chain.from_iterable(rows), dtype=np.int64, count=int(self._adj_indptr[-1]))
+        
+    def _ensure_embedding_index(self, dim):
+        """Build the embedding matrix if it is missing or stale."""
+        if (self._embedding_matrix is None
+                or self._embedding_matrix.shape[1] != dim
+                or self._index_node_count != self.knowledge_graph.number_of_nodes()):
+            self._build_embedding_index(dim)
+            
+    def _vector_search(self, query_embedding, k):
+        """Perform vector similarity search with a unit-length query."""
+        query = np.asarray(query_embedding, dtype=np.float32)
+        self._ensure_embedding_index(len(query))
+            
+        similarities = _kernels.score_cosine(query, self._embedding_matrix)
+        return [(self._node_ids[i], float(similarities[i])) for i in _kernels.top_k(similarities, k).tolist()]
 
     def _graph_expansion(self, initial_candidates):
         """Expand initial candidates through graph connections."""
-        expanded = set(node for node, _ in initial_candidates)
+        seeds = np.fromiter(
+            (self._node_index[node] for node, _ in initial_candidates),
+            dtype=np.int64,
+            count=len(initial_candidates)
+        )
+        expanded = np.zeros(len(self._node_ids), dtype=bool)
+        expanded[seeds] = True
         
-        # For each initial candidate
-        for node, _ in initial_candidates:
-            # Add neighbors to expanded set
-            neighbors = set(self.knowledge_graph.neighbors(node))
-            expanded.update(neighbors)
-            
-        return list(expanded)
+        # Add every seed's neighbors, gathered from their CSR rows at once
+        starts, ends = self._adj_indptr[seeds], self._adj_indptr[seeds + 1]
+        counts = ends - starts
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        expanded[self._adj_indices[np.repeat(starts, counts) + offsets]] = True
+        
+        return [self._node_ids[i] for i in np.flatnonzero(expanded).tolist()]
     
     def _hybrid_scoring(self, candidates, query_embedding):
         """Score candidates using vector similarity and graph metrics."""
-        scored = []
+        query = np.asarray(query_embedding, dtype=np.float32)
+        self._ensure_embedding_index(len(query))
         
-        for node in candidates:
-            node_data = self.knowledge_graph.nodes[node]
-            if "embedding" not in node_data:
-                continue
-                
-            # Vector similarity score
-            similarity = 1 - cosine(query_embedding, node_data["embedding"])
-            
-            # Graph-based importance (using degree as a simple metric)
-            importance = len(list(self.knowledge_graph.neighbors(node))) / len(self.knowledge_graph)
-            
-            # Combine scores (weighted sum)
-            final_score = 0.7 * similarity + 0.3 * importance
-            scored.append((node, final_score))
-            
-        return scored
+        # Candidates without a (matching) embedding map to -1 and are not scored
+        idx = np.fromiter(
+            (self._node_index.get(node, -1) for node in candidates),
+            dtype=np.int64,
+            count=len(candidates)
+        )
+        idx = idx[idx >= 0]
+        if not len(idx):
+            return []
+        nodes = [self._node_ids[i] for i in idx.tolist()]
+        
+        # Vector similarity scores from the gathered embedding rows
+        similarities = _kernels.score_cosine(query, self._embedding_matrix[idx])
+        
+        # Graph-based importance (using degree as a simple metric)
+        importance = self._out_degrees[idx] / len(self.knowledge_graph)
+        
+        # Combine scores (weighted sum)
+        final_scores = 0.7 * similarities + 0.3 * importance
+        return list(zip(nodes, final_scores.tolist()))
         
     def _select_top_results(self, scored_candidates, k):
         """Select top k results from scored candidates."""
-        return sorted(scored_candidates, key=lambda x: x[1], reverse=True)[:k]
\ No newline at end of file
+        scores = np.fromiter((score for _, score in scored_candidates), dtype=np.float64, count=len(scored_candidates))
+        return [scored_candidates[i] for i in _kernels.top_k(scores, k).tolist()]
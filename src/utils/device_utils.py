@@ -0,0 +1,29 @@
+import torch
+
+# Let float32 matmuls use TF32 tensor cores where the hardware has them
+torch.set_float32_matmul_precision("high")
+
+
+def get_device() -> str:
+    """Return the device models should run on."""
+    return "cuda" if torch.cuda.is_available() else "cpu"
+
+
+def get_autocast_dtype(device: str) -> torch.dtype:
+    """Return the reduced precision dtype for inference on a device.
+
+    float32 means autocast is disabled (e.g. on CPU).
+    """
+    if device == "cuda":
+        return torch.bfloat16 if torch.cuda.is_bf16_supported() else torch.float16
+    return torch.float32
+
+
+def autocast(device: str, dtype: torch.dtype, enabled: bool = True):
+    """Mixed precision context for model inference; a no-op in float32."""
+    return torch.autocast(device, dtype=dtype, enabled=enabled and dtype != torch.float32)
+
+
+def maybe_compile(model, enabled: bool = False):
+    """Wrap a model (or model method) with torch.compile when enabled in the config."""
+    return torch.compile(model, mode="reduce-overhead") if enabled else model
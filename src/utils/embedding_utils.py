@@ -1,12 +1,14 @@
 import torch
 import numpy as np
 from typing import Union, List
+from src.retrieval import _kernels
 
 def normalize_embedding(embedding: Union[np.ndarray, torch.Tensor]) -> np.ndarray:
     """Normalize embedding vector to unit length."""
     if isinstance(embedding, torch.Tensor):
         embedding = embedding.detach().cpu().numpy()
-    return embedding / np.linalg.norm(embedding)
+    embedding = np.asarray(embedding, dtype=np.float32)
+    return embedding / (np.linalg.norm(embedding) + 1e-12)
 
 def combine_embeddings(embeddings: List[np.ndarray], 
                       weights: List[float] = None) -> np.ndarray:
@@ -14,10 +16,13 @@ def combine_embeddings(embeddings: List[np.ndarray],
     if weights is None:
         weights = [1.0] * len(embeddings)
     
-    weighted_embeddings = [w * e for w, e in zip(weights, embeddings)]
-    combined = np.sum(weighted_embeddings, axis=0)
+    # One weighted sum over the stacked embeddings instead of a temporary per input
+    matrix = np.stack(embeddings).astype(np.float32, copy=False)
+    combined = np.asarray(weights, dtype=np.float32) @ matrix
     return normalize_embedding(combined)
 
 def cosine_similarity(a: np.ndarray, b: np.ndarray) -> float:
     """Calculate cosine similarity between two vectors."""
-    return np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b))
\ No newline at end of file
+    # Same dispatch as the retriever's scans, with b as a one-row matrix
+    b = np.asarray(b, dtype=np.float32)[None, :]
+    return float(_kernels.score_cosine(a, b, norms=np.linalg.norm(b, axis=1))[0])
\ No newline at end of file
@@ -0,0 +1,28 @@
+import functools
+
+from sentence_transformers import SentenceTransformer
+from transformers import AutoTokenizer, CLIPModel, CLIPProcessor
+
+
+@functools.lru_cache(maxsize=None)
+def get_sentence_transformer(model_name, device="cpu"):
+    """Load a SentenceTransformer once per (model name, device) and share it."""
+    return SentenceTransformer(model_name, device=device)
+
+
+@functools.lru_cache(maxsize=None)
+def get_tokenizer(model_name):
+    """Load a fast (Rust-backed) tokenizer once per model name."""
+    return AutoTokenizer.from_pretrained(model_name, use_fast=True)
+
+
+@functools.lru_cache(maxsize=None)
+def get_clip_processor(model_name):
+    """Load a CLIP processor once per model name."""
+    return CLIPProcessor.from_pretrained(model_name)
+
+
+@functools.lru_cache(maxsize=None)
+def get_clip_model(model_name, device="cpu"):
+    """Load CLIP weights once per (model name, device), in eval mode on that device."""
+    return CLIPModel.from_pretrained(model_name).to(device).eval()
@@ -0,0 +1,75 @@
+import logging
+import os
+from types import SimpleNamespace
+
+import torch
+
+
+class TRTRunner:
+    """Run a serialized TensorRT engine on CUDA tensors.
+
+    Called with the same keyword inputs as the HF model it was exported from
+    (e.g. pixel_values, pixel_mask) and returns a namespace of the engine's
+    named outputs (e.g. logits, pred_boxes), so downstream post-processing
+    does not change.
+    """
+
+    def __init__(self, engine_path: str):
+        import tensorrt as trt
+
+        self._trt = trt
+        logger = trt.Logger(trt.Logger.WARNING)
+        with open(engine_path, "rb") as f:
+            self.engine = trt.Runtime(logger).deserialize_cuda_engine(f.read())
+        self.context = self.engine.create_execution_context()
+
+        names = [self.engine.get_tensor_name(i) for i in range(self.engine.num_io_tensors)]
+        self.input_names = [n for n in names if self.engine.get_tensor_mode(n) == trt.TensorIOMode.INPUT]
+        self.output_names = [n for n in names if self.engine.get_tensor_mode(n) == trt.TensorIOMode.OUTPUT]
+
+    def _torch_dtype(self, name: str) -> torch.dtype:
+        """Map an engine tensor's dtype to the matching torch dtype."""
+        trt = self._trt
+        return {
+            trt.float32: torch.float32,
+            trt.float16: torch.float16,
+            trt.bfloat16: torch.bfloat16,
+            trt.int32: torch.int32,
+            trt.int64: torch.int64,
+            trt.bool: torch.bool,
+        }[self.engine.get_tensor_dtype(name)]
+
+    def __call__(self, **inputs) -> SimpleNamespace:
+        stream = torch.cuda.current_stream()
+
+        # Keep references to converted inputs alive until the engine has run
+        bound = []
+        for name in self.input_names:
+            tensor = inputs[name].to(device="cuda", dtype=self._torch_dtype(name)).contiguous()
+            self.context.set_input_shape(name, tuple(tensor.shape))
+            self.context.set_tensor_address(name, tensor.data_ptr())
+            bound.append(tensor)
+
+        outputs = {}
+        for name in self.output_names:
+            shape = tuple(self.context.get_tensor_shape(name))
+            tensor = torch.empty(shape, dtype=self._torch_dtype(name), device="cuda")
+            self.context.set_tensor_address(name, tensor.data_ptr())
+            outputs[name] = tensor
+
+        self.context.execute_async_v3(stream.cuda_stream)
+        stream.synchronize()
+        return SimpleNamespace(**outputs)
+
+
+def load_trt_engine(engine_path):
+    """Return a TRTRunner for engine_path, or None to fall back to the HF model."""
+    if not engine_path:
+        return None
+    if not torch.cuda.is_available():
+        logging.warning(f"TensorRT engine {engine_path} requires CUDA; using the HF model instead.")
+        return None
+    if not os.path.exists(engine_path):
+        logging.warning(f"TensorRT engine {engine_path} not found; using the HF model instead.")
+        return None
+    return TRTRunner(engine_path)
@@ -1,4 +1,5 @@
 import networkx as nx
+import numpy as np
 import matplotlib.pyplot as plt
 from typing import Dict, List
 import plotly.graph_objects as go
@@ -6,29 +7,38 @@ import plotly.graph_objects as go
 class GraphVisualizer:
     def __init__(self, config):
         self.config = config
+        # Above this many nodes the force-directed layout is too slow to be useful
+        self.max_spring_layout_nodes = (
+            config.get("max_spring_layout_nodes", 10000) if isinstance(config, dict) else 10000
+        )
         
     def visualize_knowledge_graph(self, 
                                 graph: nx.DiGraph,
                                 highlight_nodes: List[str] = None,
                                 output_path: str = None):
         """Visualize the knowledge graph using Plotly."""
-        # Create position layout
-        pos = nx.spring_layout(graph, k=1, iterations=50)
+        # Create position layout as one (N, 2) array indexed by node position
+        if len(graph) > self.max_spring_layout_nodes:
+            pos = nx.random_layout(graph)
+        else:
+            pos = nx.spring_layout(graph, k=1, iterations=50)
+        node_list = list(graph.nodes())
+        node_to_idx = {node: i for i, node in enumerate(node_list)}
+        pos_arr = np.array([pos[node] for node in node_list], dtype=np.float64).reshape(len(node_list), 2)
         
         # Prepare node traces
-        node_types = set(nx.get_node_attributes(graph, 'type').values())
+        nodes_by_type = {}
+        for node, attr in graph.nodes(data=True):
+            if 'type' in attr:
+                nodes_by_type.setdefault(attr['type'], []).append(node)
         node_traces = {}
         
-        for node_type in node_types:
-            nodes = [n for n, attr in graph.nodes(data=True) 
-                    if attr.get('type') == node_type]
-            
-            x = [pos[node][0] for node in nodes]
-            y = [pos[node][1] for node in nodes]
+        for node_type, nodes in nodes_by_type.items():
+            idx = np.fromiter((node_to_idx[node] for node in nodes), dtype=np.int64, count=len(nodes))
             
             node_traces[node_type] = go.Scatter(
-                x=x,
-                y=y,
+                x=pos_arr[idx, 0],
+                y=pos_arr[idx, 1],
                 mode='markers+text',
                 name=node_type,
                 text=[self._get_node_label(graph, node) for node in nodes],
@@ -39,17 +49,16 @@ class GraphVisualizer:
                 )
             )
             
-        # Prepare edge trace
-        edge_x = []
-        edge_y = []
-        edge_text = []
-        
-        for edge in graph.edges(data=True):
-            x0, y0 = pos[edge[0]]
-            x1, y1 = pos[edge[1]]
-            edge_x.extend([x0, x1, None])
-            edge_y.extend([y0, y1, None])
-            edge_text.append(edge[2].get('type', ''))
+        # Prepare edge trace: (source, target, gap) triples, with NaN gaps
+        # separating the line segments
+        edges = list(graph.edges(data=True))
+        src_idx = np.fromiter((node_to_idx[u] for u, _, _ in edges), dtype=np.int64, count=len(edges))
+        dst_idx = np.fromiter((node_to_idx[v] for _, v, _ in edges), dtype=np.int64, count=len(edges))
+        edge_x = np.full(3 * len(edges), np.nan)
+        edge_y = np.full(3 * len(edges), np.nan)
+        edge_x[0::3], edge_x[1::3] = pos_arr[src_idx, 0], pos_arr[dst_idx, 0]
+        edge_y[0::3], edge_y[1::3] = pos_arr[src_idx, 1], pos_arr[dst_idx, 1]
+        edge_text = [data.get('type', '') for _, _, data in edges]
             
         edge_trace = go.Scatter(
             x=edge_x,
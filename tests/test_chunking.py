@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+
+from src.chunking.chunk_utils import SectionCache
+from src.chunking.semantic_chunker import SemanticContextPreservingChunker
+
+
+def _chunker(max_chunk_size):
+    # Boundary search only needs the size limit, so skip loading the tokenizer
+    chunker = SemanticContextPreservingChunker.__new__(SemanticContextPreservingChunker)
+    chunker.max_chunk_size = max_chunk_size
+    return chunker
+
+
+def _greedy_boundaries(lengths, max_chunk_size):
+    """Sentence packing as the chunker did it before the cumulative-sum search."""
+    boundaries = []
+    start = None
+    current_tokens = 0
+    for idx, sent_tokens in enumerate(lengths):
+        if current_tokens + sent_tokens > max_chunk_size:
+            if start is not None:
+                boundaries.append((start, idx))
+            start = idx
+            current_tokens = sent_tokens
+        else:
+            start = idx if start is None else start
+            current_tokens += sent_tokens
+    if start is not None:
+        boundaries.append((start, len(lengths)))
+    return boundaries
+
+
+def test_chunk_boundaries_empty_input():
+    assert _chunker(10)._chunk_boundaries([]) == []
+
+
+def test_chunk_boundaries_exact_fit_stays_in_one_chunk():
+    assert _chunker(10)._chunk_boundaries([4, 6, 5, 5]) == [(0, 2), (2, 4)]
+
+
+def test_chunk_boundaries_oversize_sentence_is_its_own_chunk():
+    assert _chunker(10)._chunk_boundaries([3, 25, 2, 4]) == [(0, 1), (1, 2), (2, 4)]
+
+
+def test_chunk_boundaries_oversize_first_sentence():
+    assert _chunker(10)._chunk_boundaries([11, 1]) == [(0, 1), (1, 2)]
+
+
+@pytest.mark.parametrize("seed", range(50))
+def test_chunk_boundaries_match_greedy_packing(seed):
+    rng = np.random.default_rng(seed)
+    lengths = rng.integers(1, 40, size=rng.integers(0, 30)).tolist()
+    assert _chunker(32)._chunk_boundaries(lengths) == _greedy_boundaries(lengths, 32)
+
+
+def test_section_cache_round_trip(tmp_path):
+    cache = SectionCache(str(tmp_path), "tokenizer-a")
+    value = ([(0, 5), (6, 12)], [2, 3])
+    cache.put_many([("Hello world again", value)])
+    assert cache.get_many(["Hello world again", "unseen"]) == [value, None]
+
+
+def test_section_cache_persists_across_instances(tmp_path):
+    SectionCache(str(tmp_path), "tokenizer-a").put_many([("text", ([(0, 4)], [1]))])
+    assert SectionCache(str(tmp_path), "tokenizer-a").get_many(["text"]) == [([(0, 4)], [1])]
+
+
+def test_section_cache_is_namespaced_by_tokenizer(tmp_path):
+    SectionCache(str(tmp_path), "tokenizer-a").put_many([("text", ([(0, 4)], [1]))])
+    assert SectionCache(str(tmp_path), "tokenizer-b").get_many(["text"]) == [None]
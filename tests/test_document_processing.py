@@ -0,0 +1,48 @@
+from types import SimpleNamespace
+
+from src.document_processing.figure_extractor import FigureExtractor
+
+
+class _FakePage:
+    """Minimal stand-in for a fitz page that only serves get_text("dict")."""
+
+    def __init__(self, blocks):
+        self._blocks = blocks
+
+    def get_text(self, option):
+        assert option == "dict"
+        return {"blocks": self._blocks}
+
+
+def _text_block(lines, bbox=(0, 110, 100, 130)):
+    return {
+        "type": 0,
+        "bbox": bbox,
+        "lines": [{"spans": [{"text": text} for text in spans]} for spans in lines]
+    }
+
+
+def _caption_extractor():
+    # Caption lookup needs no CLIP model, so skip __init__
+    extractor = FigureExtractor.__new__(FigureExtractor)
+    extractor.config = SimpleNamespace(caption_distance_threshold=100)
+    return extractor
+
+
+IMG = (0, 0, 0, 100, 100)  # xref, x0, y0, x1, y1
+
+
+def test_caption_keyword_on_second_line_is_found():
+    page = _FakePage([_text_block([["as shown in the plot, see"], ["Figure 2", ": results"]])])
+    caption = _caption_extractor()._find_figure_caption(page, IMG)
+    assert caption == "as shown in the plot, see\nFigure 2: results"
+
+
+def test_caption_spans_within_a_line_are_joined_without_separator():
+    page = _FakePage([_text_block([["Fig", ". 3 ", "overview"]])])
+    assert _caption_extractor()._find_figure_caption(page, IMG) == "Fig. 3 overview"
+
+
+def test_caption_requires_keyword_at_word_boundary():
+    page = _FakePage([_text_block([["reconfigure the"], ["pipeline"]])])
+    assert _caption_extractor()._find_figure_caption(page, IMG) == ""
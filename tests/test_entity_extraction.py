@@ -0,0 +1,133 @@
+import numpy as np
+import pytest
+
+from src.entity_extraction import entity_extractor, relationship_extractor
+from src.entity_extraction.entity_extractor import EntityExtractor
+
+
+def _greedy_merge(entities):
+    """Overlap resolution as _merge_entities did it before the array sweep."""
+    merged = sorted(entities, key=lambda x: x["start"])
+    result = []
+    current = merged[0]
+    for next_entity in merged[1:]:
+        current_end = current["start"] + len(current["text"])
+        if next_entity["start"] >= current_end:
+            result.append(current)
+            current = next_entity
+        elif len(next_entity["text"]) > len(current["text"]):
+            current = next_entity
+    result.append(current)
+    return result
+
+
+def _random_spans(rng, count):
+    """Entities with clustered starts so that overlaps and ties are common."""
+    starts = rng.integers(0, 40, size=count)
+    lengths = rng.integers(1, 12, size=count)
+    return [
+        {"text": "x" * int(length), "type": "TEST", "start": int(start), "idx": idx}
+        for idx, (start, length) in enumerate(zip(starts, lengths))
+    ]
+
+
+def _span_arrays(entities):
+    starts = np.array([entity["start"] for entity in entities], dtype=np.int64)
+    lengths = np.array([len(entity["text"]) for entity in entities], dtype=np.int64)
+    return starts, lengths, np.argsort(starts, kind="stable")
+
+
+@pytest.mark.parametrize("seed", range(50))
+def test_resolve_overlaps_python_matches_greedy_merge(seed):
+    entities = _random_spans(np.random.default_rng(seed), 30)
+    starts, lengths, order = _span_arrays(entities)
+    keep = entity_extractor._resolve_overlaps_python(starts.tolist(), lengths.tolist(), order.tolist())
+    assert [entities[idx]["idx"] for idx in keep] == [entity["idx"] for entity in _greedy_merge(entities)]
+
+
+@pytest.mark.parametrize("seed", range(50))
+def test_resolve_overlaps_numba_matches_greedy_merge(seed):
+    pytest.importorskip("numba")
+    entities = _random_spans(np.random.default_rng(seed), 30)
+    starts, lengths, order = _span_arrays(entities)
+    keep = entity_extractor._resolve_overlaps_numba(starts, lengths, order).tolist()
+    assert [entities[idx]["idx"] for idx in keep] == [entity["idx"] for entity in _greedy_merge(entities)]
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_merge_entities_matches_greedy_merge(seed):
+    # _merge_entities does not touch the model, so skip __init__
+    extractor = EntityExtractor.__new__(EntityExtractor)
+    entities = _random_spans(np.random.default_rng(seed), 30)
+    merged = extractor._merge_entities(entities[:10], entities[10:])
+    assert [entity["idx"] for entity in merged] == [entity["idx"] for entity in _greedy_merge(entities)]
+
+
+
+def _decoder():
+    # Decoding only needs the label tables, so skip loading the NER model
+    extractor = EntityExtractor.__new__(EntityExtractor)
+    extractor._label_arr = np.array(["O", "B-PER", "I-PER", "B-ORG", "I-ORG"])
+    extractor._is_b = np.char.startswith(extractor._label_arr, "B-")
+    extractor._is_i = np.char.startswith(extractor._label_arr, "I-")
+    return extractor
+
+
+def test_decode_entities_groups_b_and_i_tokens():
+    text = "Ada Lovelace met IBM"
+    offsets = [[0, 0], [0, 3], [4, 12], [13, 16], [17, 20], [0, 0]]
+    preds = np.array([0, 1, 2, 0, 3, 0])
+    special = np.array([True, False, False, False, False, True])
+    entities = _decoder()._decode_entities(text, offsets, preds, special)
+    assert entities == [
+        {"text": "Ada Lovelace", "type": "PER", "start": 0},
+        {"text": "IBM", "type": "ORG", "start": 17}
+    ]
+
+
+def test_decode_entities_ends_run_at_special_token():
+    # A truncated chunk whose last entity is predicted to continue onto </s>
+    text = "Ada Lovelace"
+    offsets = [[0, 0], [0, 3], [4, 12], [0, 0]]
+    preds = np.array([0, 1, 2, 2])
+    special = np.array([True, False, False, True])
+    entities = _decoder()._decode_entities(text, offsets, preds, special)
+    assert entities == [{"text": "Ada Lovelace", "type": "PER", "start": 0}]
+
+
+def test_decode_entities_ignores_b_label_on_special_token():
+    offsets = [[0, 0], [0, 3], [0, 0]]
+    preds = np.array([1, 0, 3])
+    special = np.array([True, False, True])
+    assert _decoder()._decode_entities("Ada", offsets, preds, special) == []
+
+
+def _brute_force_pairs(positions, window):
+    """Every (earlier, later) position pair at most window tokens apart."""
+    return sorted(
+        (int(positions[i]), int(positions[j]))
+        for i in range(len(positions))
+        for j in range(i + 1, len(positions))
+        if positions[j] - positions[i] <= window
+    )
+
+
+def _random_positions(rng):
+    return np.sort(rng.choice(200, size=rng.integers(0, 60), replace=False)).astype(np.int64)
+
+
+@pytest.mark.parametrize("seed", range(50))
+def test_window_pairs_numpy_matches_brute_force(seed):
+    positions = _random_positions(np.random.default_rng(seed))
+    sources, targets = relationship_extractor._window_pairs_numpy(positions, 5)
+    assert sorted(zip(sources.tolist(), targets.tolist())) == _brute_force_pairs(positions, 5)
+
+
+@pytest.mark.parametrize("seed", range(50))
+def test_window_pairs_numba_matches_numpy(seed):
+    pytest.importorskip("numba")
+    positions = _random_positions(np.random.default_rng(seed))
+    numba_sources, numba_targets = relationship_extractor._window_pairs_numba(positions, 5)
+    numpy_sources, numpy_targets = relationship_extractor._window_pairs_numpy(positions, 5)
+    np.testing.assert_array_equal(numba_sources, numpy_sources)
+    np.testing.assert_array_equal(numba_targets, numpy_targets)
@@ -0,0 +1,139 @@
+import networkx as nx
+import numpy as np
+import pytest
+
+from src.retrieval import _kernels
+from src.retrieval.context_assembler import ContextAssembler
+from src.retrieval.context_retriever import ContextAwareRetriever
+
+
+def test_top_k_returns_best_first():
+    scores = np.array([0.1, 0.9, 0.4, 0.7])
+    assert _kernels.top_k(scores, 2).tolist() == [1, 3]
+
+
+def test_top_k_larger_than_input_returns_everything_sorted():
+    scores = np.array([0.2, 0.8, 0.5])
+    assert _kernels.top_k(scores, 10).tolist() == [1, 2, 0]
+
+
+def test_top_k_of_empty_or_zero_is_empty():
+    assert _kernels.top_k(np.array([]), 3).tolist() == []
+    assert _kernels.top_k(np.array([0.3, 0.1]), 0).tolist() == []
+
+
+def test_top_k_with_ties_keeps_k_distinct_indices_of_the_best_scores():
+    scores = np.array([0.5, 0.9, 0.5, 0.5, 0.1])
+    top = _kernels.top_k(scores, 3).tolist()
+    assert len(set(top)) == 3
+    assert top[0] == 1
+    assert set(top[1:]) <= {0, 2, 3}
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_top_k_matches_full_sort(seed):
+    rng = np.random.default_rng(seed)
+    # Few distinct values so that ties are common
+    scores = rng.integers(0, 5, size=rng.integers(1, 40)).astype(np.float32)
+    k = int(rng.integers(1, 50))
+    top = _kernels.top_k(scores, k)
+    np.testing.assert_array_equal(scores[top], np.sort(scores)[::-1][:k])
+
+
+def test_score_cosine_normalizes_by_given_norms():
+    query = np.array([1.0, 0.0], dtype=np.float32)
+    matrix = np.array([[3.0, 0.0], [0.0, 2.0], [1.0, 1.0]], dtype=np.float32)
+    scores = _kernels.score_cosine(query, matrix, norms=np.linalg.norm(matrix, axis=1))
+    np.testing.assert_allclose(scores, [1.0, 0.0, np.sqrt(0.5)], atol=1e-6)
+
+
+def _random_graph(rng, dim=4):
+    """DiGraph with random edges where some nodes have no embedding."""
+    graph = nx.DiGraph()
+    for node in range(30):
+        if rng.random() < 0.8:
+            graph.add_node(f"n{node}", embedding=rng.normal(size=dim).astype(np.float32))
+        else:
+            graph.add_node(f"n{node}")
+    for source, target in rng.integers(0, 30, size=(60, 2)).tolist():
+        graph.add_edge(f"n{source}", f"n{target}")
+    return graph
+
+
+def _neighbor_walk(graph, candidates):
+    """Graph expansion as the retriever did it before the CSR arrays."""
+    expanded = set(node for node, _ in candidates)
+    for node, _ in candidates:
+        expanded.update(graph.neighbors(node))
+    return expanded
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_graph_expansion_matches_neighbor_walk(seed):
+    rng = np.random.default_rng(seed)
+    graph = _random_graph(rng)
+    # The retriever only loads its encoder on first query, so no model is needed here
+    retriever = ContextAwareRetriever(graph, {})
+    retriever._ensure_embedding_index(4)
+    
+    indexed = list(retriever._node_index)
+    picks = rng.choice(len(indexed), size=min(5, len(indexed)), replace=False)
+    candidates = [(indexed[i], 0.0) for i in picks.tolist()]
+    
+    # Nodes without an embedding cannot be scored, so the CSR walk leaves them out
+    expected = _neighbor_walk(graph, candidates) & set(indexed)
+    expanded = retriever._graph_expansion(candidates)
+    assert len(expanded) == len(set(expanded))
+    assert set(expanded) == expected
+
+
+def _assembler():
+    # Approximate token counts (len // 4) stand in for the tokenizer
+    assembler = ContextAssembler.__new__(ContextAssembler)
+    assembler.fast_token_count = True
+    return assembler
+
+
+def _grouped(texts):
+    return {"text": [{"content": text} for text in texts], "table": [], "figure": [], "entity": []}
+
+
+def _budget_loop(token_counts, max_tokens):
+    """Text budget fill as the assembler did it before the prefix-sum search."""
+    kept, remaining = 0, max_tokens
+    for tokens in token_counts:
+        if remaining >= tokens:
+            kept += 1
+            remaining -= tokens
+        else:
+            break
+    return kept, max_tokens - remaining
+
+
+def test_token_budget_exact_fit_is_kept():
+    context = _assembler()._assemble_with_token_limit(_grouped(["a" * 40, "b" * 60, "c" * 4]), 25)
+    assert context["text"] == ["a" * 40, "b" * 60]
+    assert context["total_tokens"] == 25
+
+
+def test_token_budget_stops_at_first_chunk_that_does_not_fit():
+    context = _assembler()._assemble_with_token_limit(_grouped(["a" * 40, "b" * 400, "c" * 4]), 50)
+    assert context["text"] == ["a" * 40]
+    assert context["total_tokens"] == 10
+
+
+def test_token_budget_with_no_text():
+    context = _assembler()._assemble_with_token_limit(_grouped([]), 50)
+    assert context["text"] == []
+    assert context["total_tokens"] == 0
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_token_budget_matches_greedy_loop(seed):
+    rng = np.random.default_rng(seed)
+    texts = ["x" * int(n) for n in rng.integers(4, 400, size=rng.integers(0, 20))]
+    assembler = _assembler()
+    context = assembler._assemble_with_token_limit(_grouped(texts), 500)
+    kept, used = _budget_loop(assembler._count_tokens(texts), 500)
+    assert context["text"] == texts[:kept]
+    assert context["total_tokens"] == used